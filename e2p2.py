@@ -1,16 +1,21 @@
 import argparse
+import copy
 import logging.config
 import os
 import re
 import sys
 
-from src.definitions import DEFAULT_CONFIG_PATH, ROOT_DIR
+from src.definitions import DEFAULT_CONFIG_PATH, ROOT_DIR, DEFAULT_METRICS_OUTPUT_SUFFIX
 from src.bash.pipeline import *
-from src.lib.classifier import run_available_classifiers
-from src.lib.config import read_config
+from src.lib.batch import read_batch_manifest, split_batch_classifiers, write_batch_query
+from src.lib.cache import ClassifierCache
+from src.lib.classifier import Classifier, run_available_classifiers
+from src.lib.config import read_config, read_pipeline_options
 from src.lib.ensemble import run_all_ensembles
+from src.lib.metrics import get_metrics
 from src.lib.process import LoggerConfig, logging_helper, load_module_function_from_path
-from src.lib.read import get_all_seq_ids_from_fasta
+from src.lib.read import deduplicate_fasta, load_e2p2_map, preflight_fasta
+from src.lib.server import AnnotationServer
 from src.lib.write import PfFiles, write_ensemble_outputs
 
 
@@ -18,6 +23,294 @@ project_path = os.path.dirname(__file__)
 sys.path.insert(0, project_path)
 
 
+def configure_pipeline(args, config_path, classifier_dict, ensemble_dict, io_dict, time_stamp):
+    """Overwrite the config with arguments and read it with the query of the run
+    Args:
+        args: parsed arguments
+        config_path: Path to config.ini
+        classifier_dict: Classifier sections read from the config
+        ensemble_dict: Ensemble sections read from the config
+        io_dict: IO section used for interpolation
+        time_stamp: time stamp
+    Raises:
+    Returns:
+        classifier dict, uninterpolated classifier dict, ensemble dict, pipeline options
+    """
+    overwrites = {}
+    for cls in classifier_dict:
+        cls_path = os.path.join(ROOT_DIR, classifier_dict[cls]["class"])
+        cls_fn = load_module_function_from_path(cls_path, cls)
+        io_dict["IO"][cls] = cls_fn.generate_output_paths(io_dict["IO"]["query"], io_dict["IO"]["out"], cls, time_stamp)
+        cls_fn.config_overwrites(args, overwrites)
+    for ens in ensemble_dict:
+        ens_path = os.path.join(ROOT_DIR, ensemble_dict[ens]["class"])
+        ens_fn = load_module_function_from_path(ens_path, ens)
+        ens_fn.config_overwrites(args, overwrites)
+    pipeline_config_overwrites(args, overwrites)
+    _, classifier_dict, ensemble_dict = read_config(config_path, io_dict, overwrites)
+    # Classifiers are set up from the uninterpolated commands so that they can be set up again on query shards
+    _, classifier_templates, _ = read_config(config_path, io_dict, overwrites, raw=True)
+    pipeline_options = read_pipeline_options(config_path, overwrites, logger_name=DEFAULT_LOGGER_NAME)
+    return classifier_dict, classifier_templates, ensemble_dict, pipeline_options
+
+
+def setup_and_run_classifiers(args, classifier_dict, classifier_templates, pipeline_options, io_dict, duplicate_ids,
+                              time_stamp, logging_level):
+    """Set up the classifiers of the config on the query and run them
+    Args:
+        args: parsed arguments
+        classifier_dict: Classifier sections read from the config
+        classifier_templates: Uninterpolated classifier sections read from the config
+        pipeline_options: Options of the [Pipeline] section
+        io_dict: IO section used for interpolation
+        duplicate_ids: key: ID of a sequence that was classified, val: IDs of its identical sequences
+        time_stamp: time stamp
+        logging_level: The logging level
+    Raises:
+    Returns:
+        list of classifiers that were run, list of classifiers that were skipped
+    """
+    metrics = get_metrics(DEFAULT_LOGGER_NAME)
+    with metrics.stage("classifier setup"):
+        classifier_names = sorted(classifier_dict.keys())
+        list_of_classifiers = []
+        for cls in classifier_names:
+            cls_path = os.path.join(ROOT_DIR, classifier_dict[cls]["class"])
+            path_to_weight = classifier_dict[cls]["weight"]
+            cls_fn = load_module_function_from_path(cls_path, cls)
+            cls_classifier = cls_fn(time_stamp=time_stamp, path_to_weight=path_to_weight, args=args)
+            cls_classifier.setup_classifier(io_dict["IO"]["query"], io_dict["IO"]["out"], classifier_templates[cls])
+            list_of_classifiers.append(cls_classifier)
+
+    cache = None
+    if pipeline_options["cache_dir"] is not None:
+        cache = ClassifierCache(pipeline_options["cache_dir"], pipeline_options["cache_size"],
+                                logging_level=logging_level, logger_name=DEFAULT_LOGGER_NAME)
+    with metrics.stage("classifiers") as record:
+        res_cls_list, skipped_classifiers = \
+            run_available_classifiers(classifier_names, list_of_classifiers, logging_level, DEFAULT_LOGGER_NAME,
+                                      num_of_shards=pipeline_options["shards"], shard_folder=io_dict["IO"]["out"],
+                                      max_processes=pipeline_options["processes"],
+                                      max_cpus=pipeline_options["max_cpus"],
+                                      max_memory=pipeline_options["max_memory"],
+                                      log_folder=io_dict["IO"]["out"], cache=cache)
+        for cls_classifier in res_cls_list:
+            cls_classifier.expand_res(duplicate_ids)
+        record["hits"] = sum([len(hits) for cls_classifier in res_cls_list for hits in cls_classifier.res.values()])
+    return res_cls_list, skipped_classifiers
+
+
+def run_ensembles_and_write_outputs(res_cls_list, ensemble_dict, mapping_files, all_query_ids, output_path,
+                                    prot_gene_map_path, time_stamp, logging_level):
+    """Run the ensembles of the config on classifier results and write their outputs
+    Args:
+        res_cls_list: list of classifiers that were run
+        ensemble_dict: Ensemble sections read from the config
+        mapping_files: Mapping section read from the config
+        all_query_ids: list of all query IDs
+        output_path: output path to the short output file
+        prot_gene_map_path: Path to protein to gene ID mapping
+        time_stamp: time stamp
+        logging_level: The logging level
+    Raises:
+    Returns:
+    """
+    # Set up ensembles
+    ensemble_names = sorted(ensemble_dict.keys())
+    list_of_ensembles = []
+    for ens in ensemble_names:
+        ens_path = os.path.join(ROOT_DIR, ensemble_dict[ens]["class"])
+        threshold = ensemble_dict[ens]["threshold"]
+        ens_fn = load_module_function_from_path(ens_path, ens)
+        ens_ensemble = ens_fn(res_cls_list, time_stamp, ens, threshold)
+        list_of_ensembles.append(ens_ensemble)
+
+    # Run Ensembles
+    ensembles_ran, skipped_ensembles = \
+        run_all_ensembles(ensemble_names, list_of_ensembles, all_query_ids, DEFAULT_LOGGER_NAME)
+
+    for ensemble_cls in ensembles_ran:
+        # ensemble_name = ensemble_cls.name
+        # ensemble_classifiers = ensemble_cls.list_of_classifiers
+        write_ensemble_outputs(ensemble_cls, all_query_ids, output_path,
+                               os.path.join(ROOT_DIR, mapping_files['efclasses']),
+                               os.path.join(ROOT_DIR, mapping_files['ec_superseded']),
+                               os.path.join(ROOT_DIR, mapping_files['metacyc_rxn_ec']),
+                               os.path.join(ROOT_DIR, mapping_files['official_ec_metacyc_rxn']),
+                               os.path.join(ROOT_DIR, mapping_files['to_remove_non_small_molecule_metabolism']),
+                               prot_gene_map_path=prot_gene_map_path, logging_level=logging_level,
+                               logger_name=DEFAULT_LOGGER_NAME)
+
+
+def run_e2p2(args, config_path, mapping_files, classifier_dict, ensemble_dict, io_dict, output_path, time_stamp,
+             logging_level):
+    """Run E2P2 on one input
+    Args:
+        args: parsed arguments
+        config_path: Path to config.ini
+        mapping_files: Mapping section read from the config
+        classifier_dict: Classifier sections read from the config
+        ensemble_dict: Ensemble sections read from the config
+        io_dict: IO section used for interpolation
+        output_path: output path to the short output file
+        time_stamp: time stamp
+        logging_level: The logging level
+    Raises:
+    Returns:
+    """
+    metrics = get_metrics(DEFAULT_LOGGER_NAME)
+    with metrics.stage("preflight") as record:
+        fasta_path = \
+            protein_to_gene_helper(args.input_file, output_path, args.protein_gene_path, args.remove_splice_variants,
+                                   logger_name=DEFAULT_LOGGER_NAME)
+        # The preflight from start_pipeline, or the one recorded while removing splice variants, is reused here
+        all_query_ids = preflight_fasta(fasta_path, logger_name=DEFAULT_LOGGER_NAME).ids
+        record["queries"] = len(all_query_ids)
+
+    # Identical sequences are classified once and their results copied back after the classifiers ran
+    with metrics.stage("deduplicate") as record:
+        if args.no_deduplicate:
+            query_path, duplicate_ids = fasta_path, {}
+        else:
+            query_path, duplicate_ids = \
+                deduplicate_fasta(fasta_path, io_dict["IO"]["out"], logger_name=DEFAULT_LOGGER_NAME)
+        record["queries"] = len(all_query_ids) - sum([len(same_seq_ids) for same_seq_ids in duplicate_ids.values()])
+    io_dict["IO"]["query"] = query_path
+
+    # Overwrite config with arguments
+    with metrics.stage("config"):
+        classifier_dict, classifier_templates, ensemble_dict, pipeline_options = \
+            configure_pipeline(args, config_path, classifier_dict, ensemble_dict, io_dict, time_stamp)
+
+    # Run Classifiers
+    res_cls_list, skipped_classifiers = \
+        setup_and_run_classifiers(args, classifier_dict, classifier_templates, pipeline_options, io_dict,
+                                  duplicate_ids, time_stamp, logging_level)
+
+    run_ensembles_and_write_outputs(res_cls_list, ensemble_dict, mapping_files, all_query_ids, output_path,
+                                    args.protein_gene_path, time_stamp, logging_level)
+
+
+def run_batch(args, config_path, mapping_files, classifier_dict, ensemble_dict, io_dict, output_folder, time_stamp,
+              logging_level):
+    """Run E2P2 on every genome of a batch manifest. Maps, weights and plugins are loaded once, the classifiers run
+       once on the sequences of all genomes, and each genome's outputs are written to a folder of its own.
+    Args:
+        args: parsed arguments
+        config_path: Path to config.ini
+        mapping_files: Mapping section read from the config
+        classifier_dict: Classifier sections read from the config
+        ensemble_dict: Ensemble sections read from the config
+        io_dict: IO section used for interpolation
+        output_folder: Folder the output folders of the genomes are created in
+        time_stamp: time stamp
+        logging_level: The logging level
+    Raises:
+    Returns:
+    """
+    metrics = get_metrics(DEFAULT_LOGGER_NAME)
+    with metrics.stage("preflight") as record:
+        genomes = read_batch_manifest(args.manifest, output_folder, logger_name=DEFAULT_LOGGER_NAME)
+        for genome in genomes:
+            os.makedirs(genome.output_folder, exist_ok=True)
+            check_fasta_header(genome.input_path, logger_name=DEFAULT_LOGGER_NAME)
+            genome.fasta_path = \
+                protein_to_gene_helper(genome.input_path, genome.output_path, genome.protein_gene_path,
+                                       args.remove_splice_variants, logger_name=DEFAULT_LOGGER_NAME)
+            genome.query_ids = preflight_fasta(genome.fasta_path, logger_name=DEFAULT_LOGGER_NAME).ids
+        batch_query_path = os.path.join(io_dict["IO"]["out"], '.'.join(["batch", time_stamp, "fa"]))
+        query_map = write_batch_query(genomes, batch_query_path, logger_name=DEFAULT_LOGGER_NAME)
+        record["queries"] = len(query_map)
+
+    # Identical sequences, within or across genomes, are classified once
+    with metrics.stage("deduplicate") as record:
+        if args.no_deduplicate:
+            query_path, duplicate_ids = batch_query_path, {}
+        else:
+            query_path, duplicate_ids = \
+                deduplicate_fasta(batch_query_path, io_dict["IO"]["out"], logger_name=DEFAULT_LOGGER_NAME)
+        record["queries"] = len(query_map) - sum([len(same_seq_ids) for same_seq_ids in duplicate_ids.values()])
+    io_dict["IO"]["query"] = query_path
+
+    with metrics.stage("config"):
+        classifier_dict, classifier_templates, ensemble_dict, pipeline_options = \
+            configure_pipeline(args, config_path, classifier_dict, ensemble_dict, io_dict, time_stamp)
+
+    res_cls_list, skipped_classifiers = \
+        setup_and_run_classifiers(args, classifier_dict, classifier_templates, pipeline_options, io_dict,
+                                  duplicate_ids, time_stamp, logging_level)
+
+    for genome, genome_classifiers in zip(genomes, split_batch_classifiers(res_cls_list, query_map, len(genomes))):
+        logging_helper("Writing outputs of genome \"" + genome.name + "\" to \"" + genome.output_folder + "\"",
+                       logging_level="INFO", logger_name=DEFAULT_LOGGER_NAME)
+        run_ensembles_and_write_outputs(genome_classifiers, ensemble_dict, mapping_files, genome.query_ids,
+                                        genome.output_path, genome.protein_gene_path, time_stamp, logging_level)
+
+
+def preload_references(mapping_files, classifier_dict, logging_level):
+    """Read the maps and classifier weights ahead of the first run, later runs reuse them
+    Args:
+        mapping_files: Mapping section read from the config
+        classifier_dict: Classifier sections read from the config
+        logging_level: The logging level
+    Raises: OSError
+    Returns:
+    """
+    load_e2p2_map(os.path.join(ROOT_DIR, mapping_files['efclasses']), 0, 1)
+    load_e2p2_map(os.path.join(ROOT_DIR, mapping_files['ec_superseded']), 2, 0)
+    load_e2p2_map(os.path.join(ROOT_DIR, mapping_files['metacyc_rxn_ec']), 1, 0)
+    load_e2p2_map(os.path.join(ROOT_DIR, mapping_files['official_ec_metacyc_rxn']), 0, 1)
+    load_e2p2_map(os.path.join(ROOT_DIR, mapping_files['to_remove_non_small_molecule_metabolism']), 0, 0)
+    for cls in classifier_dict:
+        try:
+            path_to_weight = classifier_dict[cls]["weight"]
+        except KeyError:
+            continue
+        if path_to_weight is not None and os.path.isfile(path_to_weight):
+            Classifier.read_weights(path_to_weight, logging_level=logging_level, logger_name=DEFAULT_LOGGER_NAME)
+
+
+def run_server(args, config_path, mapping_files, classifier_dict, ensemble_dict, work_folder, logging_level):
+    """Serve E2P2 jobs until interrupted. Maps, weights and plugins stay loaded between jobs, and jobs queued
+       together run as one batch so the classifiers start once for all of them.
+    Args:
+        args: parsed arguments
+        config_path: Path to config.ini
+        mapping_files: Mapping section read from the config
+        classifier_dict: Classifier sections read from the config
+        ensemble_dict: Ensemble sections read from the config
+        work_folder: Folder of the server's jobs and batches
+        logging_level: The logging level
+    Raises: OSError
+    Returns:
+    """
+    preload_references(mapping_files, classifier_dict, logging_level)
+    metrics = get_metrics(DEFAULT_LOGGER_NAME)
+
+    def run_jobs(jobs, batch_folder):
+        batch_time_stamp = str(int(time.time()))
+        manifest_path = os.path.join(batch_folder, "manifest.tsv")
+        with open(manifest_path, 'w') as op:
+            for job in jobs:
+                op.write(job.fasta_path + '\n')
+        batch_args = copy.copy(args)
+        batch_args.manifest = manifest_path
+        output_folder, io_dict, _, _, _ = \
+            start_batch(manifest_path, output_folder=server.jobs_dir, temp_folder=batch_folder,
+                        timestamp=batch_time_stamp)
+        try:
+            run_batch(batch_args, config_path, mapping_files, classifier_dict, ensemble_dict, io_dict, output_folder,
+                      batch_time_stamp, logging_level)
+        finally:
+            metrics.write_json(os.path.join(batch_folder, '.'.join(["batch", DEFAULT_METRICS_OUTPUT_SUFFIX])))
+            metrics.reset()
+
+    server = AnnotationServer(run_jobs, work_folder, batch_size=args.batch_size, batch_wait=args.batch_wait,
+                              max_batches=args.max_batches, max_queued=args.max_queued,
+                              logger_name=DEFAULT_LOGGER_NAME)
+    server.serve(host=args.host, port=args.port, socket_path=args.socket_path)
+
+
 def main():
     name = 'e2p2.py'
     description = '''
@@ -29,14 +322,26 @@ def main():
     - Input protein sequences should be in FASTA format.
     - Headers in the FASTA file should begin with the sequence ID followed by a space or "|".
     - Intermediate results files can be found in a temporary directory of its own subdirectory labeled with a date and time stamp.
+    - "batch" runs every genome listed in a manifest, see "batch --help".
+    - "serve" keeps E2P2 loaded and runs FASTA jobs submitted over HTTP, see "serve --help".
     '''
     time_stamp = str(int(time.time()))
+    metrics = get_metrics(DEFAULT_LOGGER_NAME)
     cur_logger_config = LoggerConfig()
     parser = argparse.ArgumentParser(prog=name, description=description, formatter_class=argparse.RawTextHelpFormatter,
                                      epilog=textwrap.dedent(notes))
     add_io_arguments(parser)
+    add_process_arguments(parser)
+    parser.set_defaults(mode="e2p2")
     subparsers = parser.add_subparsers()
     parser_e2p2 = subparsers.add_parser('e2p2', help=textwrap.dedent("Argument to run E2P2."))
+    parser_e2p2.set_defaults(mode="e2p2")
+    parser_batch = subparsers.add_parser('batch', help=textwrap.dedent("Argument to run E2P2 on a batch of genomes."))
+    parser_batch.set_defaults(mode="batch")
+    add_batch_arguments(parser_batch)
+    parser_serve = subparsers.add_parser('serve', help=textwrap.dedent("Argument to serve E2P2 jobs over HTTP."))
+    parser_serve.set_defaults(mode="serve")
+    add_server_arguments(parser_serve)
 
     # Config read in
     args, others = parser.parse_known_args()
@@ -55,17 +360,34 @@ def main():
         cls_path = os.path.join(ROOT_DIR, classifier_dict[cls]["class"])
         cls_fn = load_module_function_from_path(cls_path, cls)
         cls_fn.add_arguments(parser_e2p2)
+        cls_fn.add_arguments(parser_batch)
+        cls_fn.add_arguments(parser_serve)
 
     for ens in ensemble_dict:
         ens_path = os.path.join(ROOT_DIR, ensemble_dict[ens]["class"])
         ens_fn = load_module_function_from_path(ens_path, ens)
         ens_fn.add_arguments(parser_e2p2)
+        ens_fn.add_arguments(parser_batch)
+        ens_fn.add_arguments(parser_serve)
 
     # Parse arguments
     args = parser.parse_args()
-    output_path, io_dict, create_temp_folder_flag, log_path, logging_level = \
-        start_pipeline(args.input_file, output_path=args.output_path, temp_folder=args.temp_folder,
-                       log_path=args.log_path, verbose=args.verbose, timestamp=time_stamp)
+    with metrics.stage("start pipeline"):
+        if args.mode == "batch":
+            output_path, io_dict, create_temp_folder_flag, log_path, logging_level = \
+                start_batch(args.manifest, output_folder=args.output_path, temp_folder=args.temp_folder,
+                            log_path=args.log_path, verbose=args.verbose, timestamp=time_stamp)
+        elif args.mode == "serve":
+            output_path, log_path, logging_level = \
+                start_server(work_folder=args.output_path, log_path=args.log_path, verbose=args.verbose,
+                             timestamp=time_stamp)
+            io_dict, create_temp_folder_flag = {"IO": {"out": output_path}}, False
+        elif args.input_file is None:
+            parser.error("the following arguments are required: --input/-i")
+        else:
+            output_path, io_dict, create_temp_folder_flag, log_path, logging_level = \
+                start_pipeline(args.input_file, output_path=args.output_path, temp_folder=args.temp_folder,
+                               log_path=args.log_path, verbose=args.verbose, timestamp=time_stamp)
 
 
     if os.path.isfile(os.path.realpath(log_path)):
@@ -86,70 +408,24 @@ def main():
     if config_log_flag is True:
         logging_helper("No user provided config.ini is found, attempting to use file at %s." % DEFAULT_CONFIG_PATH,
                        logging_level="INFO", logger_name=DEFAULT_LOGGER_NAME)
-    fasta_path = \
-        protein_to_gene_helper(args.input_file, output_path, args.protein_gene_path, args.remove_splice_variants,
-                               logger_name=DEFAULT_LOGGER_NAME)
-    io_dict["IO"]["query"] = fasta_path
 
-    all_query_ids = get_all_seq_ids_from_fasta(fasta_path)
-
-    # Overwrite config with arguments
-    overwrites = {}
-    for cls in classifier_dict:
-        cls_path = os.path.join(ROOT_DIR, classifier_dict[cls]["class"])
-        cls_fn = load_module_function_from_path(cls_path, cls)
-        io_dict["IO"][cls] = cls_fn.generate_output_paths(io_dict["IO"]["query"], io_dict["IO"]["out"], cls, time_stamp)
-        cls_fn.config_overwrites(args, overwrites)
-    for ens in ensemble_dict:
-        ens_path = os.path.join(ROOT_DIR, ensemble_dict[ens]["class"])
-        ens_fn = load_module_function_from_path(ens_path, ens)
-        ens_fn.config_overwrites(args, overwrites)
-    _, classifier_dict, ensemble_dict = read_config(config_path, io_dict, overwrites)
-
-    # Set up classifiers
-    classifier_names = sorted(classifier_dict.keys())
-    list_of_classifiers = []
-    for cls in classifier_names:
-        cls_path = os.path.join(ROOT_DIR, classifier_dict[cls]["class"])
-        path_to_weight = classifier_dict[cls]["weight"]
-        cls_fn = load_module_function_from_path(cls_path, cls)
-        cls_classifier = cls_fn(time_stamp=time_stamp, path_to_weight=path_to_weight, args=args)
-        cls_classifier.setup_classifier(io_dict["IO"]["query"], io_dict["IO"]["out"], classifier_dict[cls])
-        list_of_classifiers.append(cls_classifier)
-
-    # Run Classifiers
-    res_cls_list, skipped_classifiers = \
-        run_available_classifiers(classifier_names, list_of_classifiers, logging_level, DEFAULT_LOGGER_NAME)
-
-    # Set up ensembles
-    ensemble_names = sorted(ensemble_dict.keys())
-    list_of_ensembles = []
-    for ens in ensemble_names:
-        ens_path = os.path.join(ROOT_DIR, ensemble_dict[ens]["class"])
-        threshold = ensemble_dict[ens]["threshold"]
-        ens_fn = load_module_function_from_path(ens_path, ens)
-        ens_ensemble = ens_fn(res_cls_list, time_stamp, ens, threshold)
-        list_of_ensembles.append(ens_ensemble)
-
-    # Run Ensembles
-    ensembles_ran, skipped_ensembles = \
-        run_all_ensembles(ensemble_names, list_of_ensembles, all_query_ids, DEFAULT_LOGGER_NAME)
+    if args.mode == "serve":
+        run_server(args, config_path, mapping_files, classifier_dict, ensemble_dict, output_path, logging_level)
+        return
+    elif args.mode == "batch":
+        run_batch(args, config_path, mapping_files, classifier_dict, ensemble_dict, io_dict, output_path, time_stamp,
+                  logging_level)
+        metrics_output_path = os.path.join(output_path, '.'.join(["batch", DEFAULT_METRICS_OUTPUT_SUFFIX]))
+    else:
+        run_e2p2(args, config_path, mapping_files, classifier_dict, ensemble_dict, io_dict, output_path, time_stamp,
+                 logging_level)
+        metrics_output_path = '.'.join([os.path.splitext(output_path)[0], DEFAULT_METRICS_OUTPUT_SUFFIX])
 
-    for ensemble_cls in ensembles_ran:
-        # ensemble_name = ensemble_cls.name
-        # ensemble_classifiers = ensemble_cls.list_of_classifiers
-        write_ensemble_outputs(ensemble_cls, all_query_ids, output_path,
-                               os.path.join(ROOT_DIR, mapping_files['efclasses']),
-                               os.path.join(ROOT_DIR, mapping_files['ec_superseded']),
-                               os.path.join(ROOT_DIR, mapping_files['metacyc_rxn_ec']),
-                               os.path.join(ROOT_DIR, mapping_files['official_ec_metacyc_rxn']),
-                               os.path.join(ROOT_DIR, mapping_files['to_remove_non_small_molecule_metabolism']),
-                               prot_gene_map_path=args.protein_gene_path, logging_level=logging_level,
-                               logger_name=DEFAULT_LOGGER_NAME)
+    # Performance metrics of the run, next to the outputs
+    metrics.write_json(metrics_output_path)
+    logging_helper("Run metrics written to: \"" + metrics_output_path + "\"", logging_level=logging_level,
+                   logger_name=DEFAULT_LOGGER_NAME)
 
 
 if __name__ == '__main__':
     main()
-
-
-
@@ -3,7 +3,8 @@ import os
 import textwrap
 import time
 
-from src.definitions import DEFAULT_LOGGER_NAME, DEFAULT_OUTPUT_SUFFIX
+from src.definitions import DEFAULT_LOGGER_NAME, DEFAULT_OUTPUT_SUFFIX, DEFAULT_SERVER_HOST, DEFAULT_SERVER_PORT, \
+    DEFAULT_SERVER_BATCH_SIZE, DEFAULT_SERVER_BATCH_WAIT, DEFAULT_SERVER_MAX_BATCHES, DEFAULT_SERVER_MAX_QUEUED
 from src.lib.process import PathType, logging_helper
 from src.lib.read import check_fasta_header, remove_splice_variants_from_fasta
 
@@ -16,7 +17,7 @@ def add_io_arguments(argument_parser):
     Returns:
     """
     argument_parser.add_argument("--input", "-i", dest="input_file", type=PathType('file'),
-                                 help="Path to input protein sequences file", required=True)
+                                 help="Path to input protein sequences file, required unless running \"batch\"")
     argument_parser.add_argument("--config", "-c", dest="config_ini", type=PathType('file'),
                                  help="Path to config.ini file")
     argument_parser.add_argument("--protein_gene", "-pg", dest="protein_gene_path", type=PathType('file'),
@@ -24,8 +25,12 @@ def add_io_arguments(argument_parser):
                                       "splice variant removed fasta file and output the final version of e2p2.")
     argument_parser.add_argument("--remove_splice_variants", "-rm", dest="remove_splice_variants", action="store_true",
                                  help="Argument flag to remove splice variants.")
+    argument_parser.add_argument("--no_deduplicate", "-nd", dest="no_deduplicate", action="store_true",
+                                 help="Argument flag to classify identical sequences separately instead of once.")
     argument_parser.add_argument("--output", "-o", dest="output_path", type=PathType('have_parent'),
-                                 help="Path to output file. By Default would be in the same folder of the input.")
+                                 help="Path to output file. By Default would be in the same folder of the input. "
+                                      "For \"batch\", the folder the output folders of the genomes are created in, "
+                                      "by default the folder of the manifest.")
     argument_parser.add_argument("--temp_folder", "-tf", dest="temp_folder", type=PathType('dir'),
                                  help="Specify the location of the temp folder. "
                                       "By default would be in the same directory of the output.")
@@ -40,6 +45,98 @@ def add_io_arguments(argument_parser):
                                  help=textwrap.dedent(verbose_message))
 
 
+def add_batch_arguments(argument_parser):
+    """Function to add arguments of the batch mode
+    Args:
+        argument_parser: argparse
+    Raises:
+    Returns:
+    """
+    argument_parser.add_argument("--manifest", "-mf", dest="manifest", type=PathType('file'), required=True,
+                                 help="Path to a manifest of the genomes to run, one per line: path to the protein "
+                                      "sequences file, optionally followed by a tab and the path to its protein to "
+                                      "gene map. Relative paths are relative to the manifest.")
+
+
+def add_server_arguments(argument_parser):
+    """Function to add arguments of the server mode
+    Args:
+        argument_parser: argparse
+    Raises:
+    Returns:
+    """
+    argument_parser.add_argument("--host", dest="host", default=DEFAULT_SERVER_HOST,
+                                 help="Host the server listens on. Default is \"%s\"." % DEFAULT_SERVER_HOST)
+    argument_parser.add_argument("--port", dest="port", type=int, default=DEFAULT_SERVER_PORT,
+                                 help="Port the server listens on. Default is %d." % DEFAULT_SERVER_PORT)
+    argument_parser.add_argument("--socket", dest="socket_path", type=PathType('have_parent'),
+                                 help="Path to a Unix socket the server listens on instead of the host and port.")
+    argument_parser.add_argument("--batch_size", dest="batch_size", type=int, default=DEFAULT_SERVER_BATCH_SIZE,
+                                 help="Maximum number of queued jobs run together. Default is %d."
+                                      % DEFAULT_SERVER_BATCH_SIZE)
+    argument_parser.add_argument("--batch_wait", dest="batch_wait", type=float, default=DEFAULT_SERVER_BATCH_WAIT,
+                                 help="Seconds a job waits for more jobs to run together with. Default is %s."
+                                      % DEFAULT_SERVER_BATCH_WAIT)
+    argument_parser.add_argument("--max_batches", dest="max_batches", type=int, default=DEFAULT_SERVER_MAX_BATCHES,
+                                 help="Maximum number of job batches running at the same time. Default is %d."
+                                      % DEFAULT_SERVER_MAX_BATCHES)
+    argument_parser.add_argument("--max_queued", dest="max_queued", type=int, default=DEFAULT_SERVER_MAX_QUEUED,
+                                 help="Maximum number of queued jobs, further jobs are refused. Default is %d."
+                                      % DEFAULT_SERVER_MAX_QUEUED)
+
+
+def add_process_arguments(argument_parser):
+    """Function to add arguments on how classifier processes are run, overwriting the [Pipeline] section
+    Args:
+        argument_parser: argparse
+    Raises:
+    Returns:
+    """
+    argument_parser.add_argument("--shards", "-s", dest="shards", type=int,
+                                 help="Number of shards, balanced by residue count, the query is split into. "
+                                      "Each classifier runs once per shard. Default is 1.")
+    argument_parser.add_argument("--processes", "-p", dest="processes", type=int,
+                                 help="Maximum number of classifier processes running at the same time. "
+                                      "Default is 0, no limit.")
+    argument_parser.add_argument("--max_cpus", "-mc", dest="max_cpus", type=int,
+                                 help="Maximum number of CPUs used by the classifier processes. "
+                                      "Default is 0, all available CPUs.")
+    argument_parser.add_argument("--max_memory", "-mm", dest="max_memory",
+                                 help="Maximum memory used by the classifier processes, i.e. \"16G\", "
+                                      "megabytes if no unit is given. Default is 0, all available memory.")
+    argument_parser.add_argument("--cache_dir", "-cd", dest="cache_dir",
+                                 help="Folder where classifier outputs are cached and reused by later runs on the same "
+                                      "query, command and reference files. Default is no cache.")
+    argument_parser.add_argument("--cache_size", "-cs", dest="cache_size",
+                                 help="Maximum size of the cache, i.e. \"50G\", megabytes if no unit is given. "
+                                      "Least recently used outputs are removed first. Default is 0, no limit.")
+
+
+def pipeline_config_overwrites(args, overwrites=None):
+    """Function that returns a dictionary that will overwrite the [Pipeline] section using arguments.
+    Args:
+        args: parsed arguments
+        overwrites: a dictionary that overwrites the parsed arguments
+    Raises:
+    Returns:
+    """
+    pipeline_dest = ["shards", "processes", "max_cpus", "max_memory", "cache_dir", "cache_size"]
+    if overwrites is None:
+        overwrites = {}
+    pipeline_overwrites = {}
+    args_dict = vars(args)
+    for dest in pipeline_dest:
+        try:
+            val = args_dict[dest]
+            if val is not None:
+                pipeline_overwrites.setdefault(dest, str(val))
+        except KeyError:
+            continue
+    if len(pipeline_overwrites) > 0:
+        overwrites["Pipeline"] = pipeline_overwrites
+    return overwrites
+
+
 def add_mapping_arguments(argument_parser):
     """Function to add Enzyme Function mapping related arguments
     Args:
@@ -74,6 +171,7 @@ def start_pipeline(input_file, logger_name=DEFAULT_LOGGER_NAME, output_path=None
     Raises:
     Returns:
     """
+    # Single pass over the input, later steps reuse the cached preflight of the file
     check_fasta_header(input_file, logger_name)
     # Setup output paths
     if output_path is None:
@@ -105,6 +203,71 @@ def start_pipeline(input_file, logger_name=DEFAULT_LOGGER_NAME, output_path=None
     return output_path, io_dict, create_temp_folder_flag, log_path, logging_level
 
 
+def start_batch(manifest_path, logger_name=DEFAULT_LOGGER_NAME, output_folder=None, timestamp=str(time.time()),
+                temp_folder=None, log_path=None, verbose="0"):
+    """Function for setting up IO related variables of a batch run
+    Args:
+        manifest_path: batch manifest path
+        logger_name: logger name
+        output_folder: folder the output folders of the genomes are created in
+        timestamp: time stamp
+        temp_folder: path to the temp file folder
+        log_path: path to the log file
+        verbose: verbose level of logging
+    Raises:
+    Returns:
+    """
+    if output_folder is None:
+        output_folder = os.path.dirname(os.path.realpath(manifest_path))
+    os.makedirs(output_folder, exist_ok=True)
+    if temp_folder is None:
+        temp_folder = os.path.join(output_folder, "batch." + timestamp)
+
+    create_temp_folder_flag = False
+    try:
+        os.mkdir(temp_folder)
+        create_temp_folder_flag = True
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+        pass
+
+    # Setup logging file path
+    if log_path is None:
+        log_path = os.path.join(temp_folder, '.'.join([DEFAULT_LOGGER_NAME, timestamp, 'log']))
+    if verbose == "0":
+        logging_level = "DEBUG"
+    else:
+        logging_level = "INFO"
+
+    io_dict = {"IO": {"query": manifest_path, "out": temp_folder, "timestamp": timestamp}}
+    return output_folder, io_dict, create_temp_folder_flag, log_path, logging_level
+
+
+def start_server(logger_name=DEFAULT_LOGGER_NAME, work_folder=None, timestamp=str(time.time()), log_path=None,
+                 verbose="0"):
+    """Function for setting up IO related variables of the server
+    Args:
+        logger_name: logger name
+        work_folder: folder of the server's jobs and batches
+        timestamp: time stamp
+        log_path: path to the log file
+        verbose: verbose level of logging
+    Raises:
+    Returns:
+    """
+    if work_folder is None:
+        work_folder = os.path.join(os.getcwd(), "e2p2_server")
+    os.makedirs(work_folder, exist_ok=True)
+    if log_path is None:
+        log_path = os.path.join(work_folder, '.'.join([DEFAULT_LOGGER_NAME, timestamp, 'log']))
+    if verbose == "0":
+        logging_level = "DEBUG"
+    else:
+        logging_level = "INFO"
+    return work_folder, log_path, logging_level
+
+
 def protein_to_gene_helper(input_file, output_path, protein_gene_path, remove_splice_variants,
                            logger_name=DEFAULT_LOGGER_NAME):
     """Function for mapping protein IDs to gene IDs
@@ -25,7 +25,26 @@ DEFAULT_LONG_OUTPUT_SUFFIX = "long"
 DEFAULT_PF_OUTPUT_SUFFIX = "default.pf"
 DEFAULT_ORXN_PF_OUTPUT_SUFFIX = "orxn.pf"
 DEFAULT_FINAL_PF_OUTPUT_SUFFIX = "final.pf"
+DEFAULT_METRICS_OUTPUT_SUFFIX = "metrics.json"
 DEFAULT_PTOOLS_CHAR_LIMIT = 40
+FASTA_INDEX_SUFFIX = ".e2p2.fai"
+FASTA_INDEX_FORMAT = "e2p2-fai-1"
+
+# [Pipeline] section defaults
+DEFAULT_SHARDS = 1
+DEFAULT_PROCESSES = 0
+DEFAULT_MAX_CPUS = 0
+DEFAULT_MAX_MEMORY = 0
+DEFAULT_CACHE_DIR = None
+DEFAULT_CACHE_SIZE = 0
+
+# Server defaults
+DEFAULT_SERVER_HOST = "127.0.0.1"
+DEFAULT_SERVER_PORT = 8750
+DEFAULT_SERVER_BATCH_SIZE = 16
+DEFAULT_SERVER_BATCH_WAIT = 1.0
+DEFAULT_SERVER_MAX_BATCHES = 1
+DEFAULT_SERVER_MAX_QUEUED = 100
 
 # Website Default
 BLAST_PLUS_DOWNLOAD_LINK = "ftp://ftp.ncbi.nlm.nih.gov/blast/executables/blast+/LATEST/"
@@ -35,6 +35,7 @@ class BLAST(Classifier):
                          logging_level=DEFAULT_LOGGER_LEVEL, logger_name=DEFAULT_LOGGER_NAME):
         logging_helper("Setting up BLAST", logging_level=logging_level, logger_name=logger_name)
         self.input = input_path
+        self.config = classifier_config_dict
         self.output = self.generate_output_paths(input_path, output_path, classifier_name, self._time_stamp)
 
         [e_value_threshold, bit_score_threshold, command_string] = \
@@ -27,6 +27,7 @@ class DEEPEC(Classifier):
                          logging_level=DEFAULT_LOGGER_LEVEL, logger_name=DEFAULT_LOGGER_NAME):
         logging_helper("Setting up DeepEC", logging_level=logging_level, logger_name=logger_name)
         self.input = input_path
+        self.config = classifier_config_dict
         output_folder = self.generate_output_paths(self.input, output_path, classifier_name, self._time_stamp)
         self.output = os.path.join(output_folder, "DeepEC_Result.txt")
         [command_string] = \
@@ -27,6 +27,7 @@ class PRIAM(Classifier):
                          logging_level=DEFAULT_LOGGER_LEVEL, logger_name=DEFAULT_LOGGER_NAME):
         logging_helper("Setting up PRIAM", logging_level=logging_level, logger_name=logger_name)
         self.input = input_path
+        self.config = classifier_config_dict
         output_folder = self.generate_output_paths(self.input, output_path, classifier_name, self._time_stamp)
         self.output = os.path.join(output_folder, "PRIAM_%s" % self._time_stamp, "ANNOTATION", "sequenceECs.txt")
         [evalue_threshold, command_string] = \
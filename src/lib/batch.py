@@ -0,0 +1,126 @@
+import copy
+import os
+
+from src.definitions import DEFAULT_LOGGER_NAME, DEFAULT_OUTPUT_SUFFIX
+from src.lib.process import logging_helper
+from src.lib.read import preflight_fasta
+
+# IDs the sequences of all genomes are renamed to in the combined query, so IDs shared by genomes never clash
+BATCH_QUERY_ID_FORMAT = "E2P2Q%09d"
+BATCH_QUERY_LINE_WIDTH = 60
+
+
+class BatchGenome(object):
+    """A genome of a batch manifest
+    """
+    def __init__(self, name, input_path, protein_gene_path=None, output_folder=""):
+        """Initialize class
+        Args:
+            name: Name of the genome, also the name of its output folder
+            input_path: Path to the genome's protein sequences
+            protein_gene_path: Path to the genome's protein to gene map
+            output_folder: Folder the genome's output folder is created in
+        """
+        self.name = name
+        self.input_path = input_path
+        self.protein_gene_path = protein_gene_path
+        self.output_folder = os.path.join(output_folder, name)
+        self.output_path = os.path.join(self.output_folder, '.'.join([name, DEFAULT_OUTPUT_SUFFIX]))
+        # Protein sequences after splice variant removal
+        self.fasta_path = input_path
+        self.query_ids = []
+
+    def __repr__(self):
+        return f'BatchGenome(\'{self.name}\', \'{self.input_path}\')'
+
+
+def read_batch_manifest(manifest_path, output_folder, logger_name=DEFAULT_LOGGER_NAME):
+    """Read a batch manifest, one genome per line: path to its protein sequences, optionally followed by a tab and
+       the path to its protein to gene map. Relative paths are relative to the manifest.
+    Args:
+        manifest_path: Path to the manifest
+        output_folder: Folder the output folders of the genomes are created in
+        logger_name: The name of the logger
+    Raises: FileNotFoundError, ValueError
+    Returns:
+        List of BatchGenome
+    """
+    manifest_folder = os.path.dirname(os.path.realpath(manifest_path))
+    genomes = []
+    genome_names = set()
+    with open(manifest_path, 'r') as fp:
+        for line_num, line in enumerate(fp, 1):
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'):
+                continue
+            info = [os.path.join(manifest_folder, i.strip()) for i in line.split('\t') if i.strip() != '']
+            input_path, protein_gene_path = info[0], (info[1] if len(info) > 1 else None)
+            for path in info[:2]:
+                if not os.path.isfile(path):
+                    raise FileNotFoundError("Manifest line %d: \"%s\" not found" % (line_num, path))
+            name = os.path.splitext(os.path.basename(input_path))[0]
+            if name in genome_names:
+                raise ValueError("Manifest line %d: genome name \"%s\" used more than once" % (line_num, name))
+            genome_names.add(name)
+            genomes.append(BatchGenome(name, input_path, protein_gene_path, output_folder))
+    logging_helper("Read %d genomes from batch manifest \"%s\"" % (len(genomes), manifest_path),
+                   logging_level="INFO", logger_name=logger_name)
+    return genomes
+
+
+def write_batch_query(genomes, output_path, logger_name=DEFAULT_LOGGER_NAME):
+    """Write the protein sequences of all genomes into one query fasta, renaming every sequence
+    Args:
+        genomes: List of BatchGenome, with their fasta_path set
+        output_path: Path to the combined query fasta
+        logger_name: The name of the logger
+    Raises: OSError
+    Returns:
+        query_map: key: ID in the combined query, val: (index of the genome, sequence ID in the genome)
+    """
+    query_map = {}
+    with open(output_path, 'wb') as op:
+        for genome_idx, genome in enumerate(genomes):
+            genome_preflight = preflight_fasta(genome.fasta_path, logger_name=logger_name)
+            for idx, seq_id in enumerate(genome_preflight.ids):
+                query_id = BATCH_QUERY_ID_FORMAT % len(query_map)
+                query_map[query_id] = (genome_idx, seq_id)
+                sequence = genome_preflight.sequence_bytes(idx)
+                op.write(b'>' + query_id.encode() + b'\n')
+                op.write(b''.join([sequence[i:i + BATCH_QUERY_LINE_WIDTH] + b'\n'
+                                   for i in range(0, len(sequence), BATCH_QUERY_LINE_WIDTH)]))
+            genome_preflight.close()
+    # Index the combined query now, the following steps reuse it
+    preflight_fasta(output_path, logger_name=logger_name)
+    logging_helper("Combined %d sequences of %d genomes into \"%s\"" % (len(query_map), len(genomes), output_path),
+                   logging_level="INFO", logger_name=logger_name)
+    return query_map
+
+
+def split_batch_classifiers(classifiers, query_map, num_of_genomes):
+    """Split the results of classifiers run on a combined query into a copy of the classifiers per genome
+    Args:
+        classifiers: List of Classifier run on the combined query
+        query_map: key: ID in the combined query, val: (index of the genome, sequence ID in the genome)
+        num_of_genomes: Number of genomes
+    Raises:
+    Returns:
+        List, per genome, of the list of Classifier copies with the genome's results under its own IDs
+    """
+    genome_classifiers = [[] for _ in range(num_of_genomes)]
+    for classifier in classifiers:
+        genome_res = [{} for _ in range(num_of_genomes)]
+        for query_id, query_res in classifier.res.items():
+            try:
+                genome_idx, seq_id = query_map[query_id]
+            except KeyError:
+                continue
+            try:
+                genome_res[genome_idx][seq_id] += list(query_res)
+            except KeyError:
+                genome_res[genome_idx].setdefault(seq_id, list(query_res))
+        for genome_idx in range(num_of_genomes):
+            genome_classifier = copy.copy(classifier)
+            genome_classifier.res = genome_res[genome_idx]
+            genome_classifiers[genome_idx].append(genome_classifier)
+    return genome_classifiers
@@ -0,0 +1,188 @@
+import glob
+import hashlib
+import os
+import shutil
+import tempfile
+
+from src.definitions import DEFAULT_LOGGER_LEVEL, DEFAULT_LOGGER_NAME
+from src.lib.process import logging_helper
+
+CACHE_OUTPUT_NAME = "output"
+
+
+def file_content_hash(file_path, block_size=1 << 20):
+    """Hash the content of a file
+    Args:
+        file_path: Path to the file
+        block_size: Number of bytes read at a time
+    Raises: OSError
+    Returns:
+        Hex digest of the file content
+    """
+    content_hash = hashlib.sha256()
+    with open(file_path, 'rb') as fp:
+        for block in iter(lambda: fp.read(block_size), b''):
+            content_hash.update(block)
+    return content_hash.hexdigest()
+
+
+def reference_fingerprints(command_string):
+    """Size and modification time of the files a command refers to, i.e. databases, models and programs.
+       A path that does not exist is treated as a prefix, as BLAST databases are.
+    Args:
+        command_string: Command with its input and output paths replaced by placeholders
+    Raises:
+    Returns:
+        List of (path, size, modification time) tuples
+    """
+    fingerprints = []
+    for token in command_string.split():
+        token = token.rpartition('=')[2]
+        if not token.startswith(os.sep) and not token.startswith('.'):
+            continue
+        if os.path.isdir(token):
+            paths = [os.path.join(root, file_name) for root, _, file_names in os.walk(token)
+                     for file_name in file_names]
+        elif os.path.isfile(token):
+            paths = [token]
+        else:
+            paths = glob.glob(glob.escape(token) + '.*')
+        for path in sorted(paths):
+            try:
+                path_stat = os.stat(path)
+            except OSError:
+                continue
+            fingerprints.append((os.path.realpath(path), path_stat.st_size, path_stat.st_mtime_ns))
+    return fingerprints
+
+
+class ClassifierCache(object):
+    """Content addressed cache of classifier outputs, keyed on the query content, the classifier command and the
+       files the command refers to. Entries are evicted least recently used first once the cache exceeds its size.
+    """
+    def __init__(self, cache_dir, max_size=0, logging_level=DEFAULT_LOGGER_LEVEL, logger_name=DEFAULT_LOGGER_NAME):
+        """Initialize class
+        Args:
+            cache_dir: Folder of the cache
+            max_size: Maximum size of the cache in bytes, no limit if 0
+            logging_level: The logging level set for this cache
+            logger_name: The name of the logger for this cache
+        """
+        self.cache_dir = os.path.realpath(cache_dir)
+        self.max_size = max_size or 0
+        self.logging_level = logging_level
+        self.logger_name = logger_name
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __repr__(self):
+        return f'ClassifierCache(\'{self.cache_dir}\', {self.max_size})'
+
+    @staticmethod
+    def key(query_path, command_string):
+        """Cache key of a classifier run
+        Args:
+            query_path: Path to the query fasta
+            command_string: Command with its input and output paths replaced by placeholders
+        Raises: OSError
+        Returns:
+            Hex digest of the key
+        """
+        key_hash = hashlib.sha256()
+        key_hash.update(file_content_hash(query_path).encode())
+        key_hash.update(b'\0' + command_string.encode())
+        for path, size, mtime in reference_fingerprints(command_string):
+            key_hash.update(b'\0' + ('%s\t%d\t%d' % (path, size, mtime)).encode())
+        return key_hash.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def fetch(self, key, output_path):
+        """Place the cached output of a key at the output path
+        Args:
+            key: Cache key
+            output_path: Path the classifier output is read from
+        Raises:
+        Returns:
+            True on a cache hit
+        """
+        cached_output = os.path.join(self.entry_path(key), CACHE_OUTPUT_NAME)
+        if not os.path.isfile(cached_output):
+            return False
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        shutil.copyfile(cached_output, output_path)
+        # Mark as recently used
+        os.utime(self.entry_path(key))
+        logging_helper("Cache hit " + key + ": \"" + output_path + "\"", logging_level=self.logging_level,
+                       logger_name=self.logger_name)
+        return True
+
+    def store(self, key, output_path):
+        """Add a classifier output to the cache, then evict entries over the cache size
+        Args:
+            key: Cache key
+            output_path: Path to the classifier output
+        Raises:
+        Returns:
+        """
+        entry_path = self.entry_path(key)
+        if not os.path.isfile(output_path) or os.path.isdir(entry_path):
+            return
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        # Copy into a temporary folder first so an interrupted copy never looks like an entry
+        temp_path = tempfile.mkdtemp(prefix='.' + key, dir=os.path.dirname(entry_path))
+        try:
+            shutil.copyfile(output_path, os.path.join(temp_path, CACHE_OUTPUT_NAME))
+            os.rename(temp_path, entry_path)
+        except OSError as e:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            logging_helper("Cannot cache \"" + output_path + "\": " + str(e), logging_level="WARNING",
+                           logger_name=self.logger_name)
+            return
+        logging_helper("Cached " + key + ": \"" + output_path + "\"", logging_level=self.logging_level,
+                       logger_name=self.logger_name)
+        self.evict(keep=entry_path)
+
+    def entries(self):
+        """All cache entries
+        Args:
+        Raises:
+        Returns:
+            List of (last used time, size, entry path) tuples
+        """
+        entries = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_path = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_path):
+                continue
+            for key in os.listdir(prefix_path):
+                if key.startswith('.'):
+                    continue
+                entry_path = os.path.join(prefix_path, key)
+                try:
+                    size = os.path.getsize(os.path.join(entry_path, CACHE_OUTPUT_NAME))
+                    entries.append((os.stat(entry_path).st_mtime_ns, size, entry_path))
+                except OSError:
+                    continue
+        return entries
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until the cache fits its size
+        Args:
+            keep: Path of an entry that is not removed, i.e. the one just stored
+        Raises:
+        Returns:
+        """
+        if self.max_size <= 0:
+            return
+        entries = sorted(self.entries())
+        cache_size = sum([size for _, size, _ in entries])
+        for _, size, entry_path in entries:
+            if cache_size <= self.max_size:
+                break
+            if entry_path == keep:
+                continue
+            shutil.rmtree(entry_path, ignore_errors=True)
+            cache_size -= size
+            logging_helper("Evicted cache entry \"" + entry_path + "\"", logging_level=self.logging_level,
+                           logger_name=self.logger_name)
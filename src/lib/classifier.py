@@ -1,14 +1,20 @@
+import concurrent.futures
 import configparser
+import copy
 import multiprocessing
 import os.path
+import shutil
 
 from src.definitions import DEFAULT_LOGGER_NAME, DEFAULT_LOGGER_LEVEL
 from src.lib.config import get_values_from_config_option
 from src.lib.function_class import FunctionClass
-from src.lib.process import RunProcess, logging_helper
-from src.lib.read import read_delim_itr
+from src.lib.metrics import get_metrics
+from src.lib.process import RunProcess, ResourceScheduler, logging_helper, parse_memory
+from src.lib.read import read_delim_itr, split_fasta, _fasta_stat_key
 
 _available_class_score_attr = ['weight', 'score']
+# key: (real path, size, mtime) of a weight file, val: its weights, shared by every Classifier reading the file
+_weight_cache = {}
 
 
 class Error(Exception):
@@ -34,6 +40,8 @@ class Classifier(object):
             self.weight_map = {}
         # _command: list strings of the bash call
         self.command = None
+        # Processed config dict the classifier was set up with
+        self.config = {}
         # key: Seq ID, val: [FunctionClass, ..]
         self.res = {}
         # IO tracking
@@ -63,6 +71,7 @@ class Classifier(object):
         logging_helper("Setting up " + classifier_name, logging_level=logging_level, logger_name=logger_name)
         if os.path.isfile(input_path):
             self.input = input_path
+        self.config = classifier_config_dict
         self.output = self.generate_output_paths(input_path, output_path, classifier_name, self._time_stamp)
         [command_string] = self.classifier_config_dict_helper(self._time_stamp, self.input, self.output,
                                                               classifier_config_dict, classifier_name, ["command"],
@@ -148,9 +157,76 @@ class Classifier(object):
         except (FileNotFoundError, TypeError) as e:
             raise e
 
+    def cache_command(self, logger_name=DEFAULT_LOGGER_NAME):
+        """The classifier command with its input, output and time stamp replaced by placeholders, used to key the
+           classifier output in a cache
+        Args:
+            logger_name: The name of the logger for this command
+        Raises: AttributeError, TypeError
+        Returns:
+            Command string
+        """
+        [command_string] = self.classifier_config_dict_helper("{timestamp}", "{query}", "{output}", self.config,
+                                                              self.name, ["command"], logging_level="DEBUG",
+                                                              logger_name=logger_name)
+        return ' '.join(command_string.split())
+
+    def resource_requirements(self, logging_level=DEFAULT_LOGGER_LEVEL, logger_name=DEFAULT_LOGGER_NAME):
+        """Read the resources a process of the classifier needs from the "cpus", "memory" and "threads_option"
+           options of its config section
+        Args:
+            logging_level: The logging level set for this command
+            logger_name: The name of the logger for this command
+        Raises:
+        Returns:
+            Number of CPUs, memory in bytes, option that sets the number of threads or None
+        """
+        cpus, memory, threads_option = 1, 0, None
+        try:
+            [cpus_string, memory_string, threads_option] = \
+                self.classifier_config_dict_helper(self._time_stamp, self.input, self.output, self.config, self.name,
+                                                   ["cpus", "memory", "threads_option"], logging_level="DEBUG",
+                                                   logger_name=logger_name)
+        except TypeError:
+            return cpus, memory, threads_option
+        try:
+            if cpus_string is not None:
+                cpus = int(cpus_string)
+            memory = parse_memory(memory_string)
+        except ValueError:
+            logging_helper(self.name + " cpus or memory in config type error, using 1 CPU and no memory limit.",
+                           logging_level="WARNING", logger_name=logger_name)
+            cpus, memory = 1, 0
+        return cpus, memory, threads_option
+
+    def merge_shard_outputs(self, shard_output_paths, output_path=None, logging_level=DEFAULT_LOGGER_LEVEL,
+                            logger_name=DEFAULT_LOGGER_NAME):
+        """Concatenate the outputs of the classifier's query shards into the output it reads results from.
+        Args:
+            shard_output_paths: Output file paths of the shards, in query order
+            output_path: Output file path for the classifier
+            logging_level: The logging level set for this command
+            logger_name: The name of the logger for this command
+        Raises: OSError
+        Returns:
+        """
+        if output_path is None:
+            output_path = self.output
+        logging_helper("Merging " + str(len(shard_output_paths)) + " shard outputs into \"" + output_path + "\"",
+                       logging_level=logging_level, logger_name=logger_name)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, 'wb') as op:
+            for shard_output_path in shard_output_paths:
+                try:
+                    with open(shard_output_path, 'rb') as fp:
+                        shutil.copyfileobj(fp, op)
+                except FileNotFoundError:
+                    logging_helper("Missing shard output: \"" + shard_output_path + "\"", logging_level="ERROR",
+                                   logger_name=logger_name)
+
     @staticmethod
     def read_weights(path_to_weight, logging_level=DEFAULT_LOGGER_LEVEL, logger_name=DEFAULT_LOGGER_NAME):
-        """Read in weights from file
+        """Read in weights from file once, later calls on the unchanged file return the same dictionary
         Args:
             path_to_weight: File path to classifier's weight
             logging_level: The logging level set for this command
@@ -158,6 +234,11 @@ class Classifier(object):
         Raises: ValueError
         Returns:
         """
+        weight_key = _fasta_stat_key(path_to_weight)
+        try:
+            return _weight_cache[weight_key]
+        except KeyError:
+            pass
         logging_helper("Reading weight file: \"" + str(path_to_weight) + "\"", logging_level=logging_level,
                        logger_name=logger_name)
         weight = {}
@@ -167,19 +248,44 @@ class Classifier(object):
                     weight.setdefault(function_cls, float(cls_weight[0]))
                 except ValueError:
                     weight.setdefault(function_cls, float("0.0"))
-        return weight
+        return _weight_cache.setdefault(weight_key, weight)
 
     def get_res(self):
         return self.res
 
+    def expand_res(self, duplicate_ids):
+        """Copy the results of deduplicated sequences to the IDs of their identical sequences
+        Args:
+            duplicate_ids: key: ID of the sequence that was classified, val: IDs of the identical sequences
+        Raises:
+        Returns:
+        """
+        for seq_id, same_seq_ids in duplicate_ids.items():
+            try:
+                seq_res = self.res[seq_id]
+            except KeyError:
+                continue
+            for same_seq_id in same_seq_ids:
+                self.res[same_seq_id] = list(seq_res)
+
 
 class RunClassifiers(object):
     """Object for running all the classifiers
     """
-    def __init__(self, classifiers=None):
+    def __init__(self, classifiers=None, log_folder=None, cache=None):
         self.queue = multiprocessing.Queue()
+        # ClassifierCache of the classifier outputs, not used if None
+        self.cache = cache
+        # key: process name, val: (cache key, output path) stored in the cache once the process succeeds
+        self.process_cache_keys = {}
+        # Folder of the classifier process logs, the folder of each classifier's output if None
+        self.log_folder = log_folder
         self.run_process = RunProcess()
         self.workers = []
+        # key: classifier name, val: [Classifier, ..] set up on the query shards
+        self.shard_classifiers = {}
+        # key: process name, val: Classifier the process belongs to
+        self.process_classifiers = {}
         if classifiers is None or type(classifiers) not in [list, set]:
             self.classifiers = []
         else:
@@ -196,6 +302,54 @@ class RunClassifiers(object):
         if isinstance(classifier, Classifier):
             self.classifiers.append(classifier)
 
+    def process_log_path(self, classifier, process_name):
+        """Path of the file a classifier process' stdout and stderr are written to
+        Args:
+            classifier: A Classifier
+            process_name: Name of the process
+        Raises:
+        Returns:
+            Log file path
+        """
+        log_folder = self.log_folder
+        if log_folder is None:
+            log_folder = os.path.dirname(classifier.output)
+        return os.path.join(log_folder, '.'.join([process_name.replace(':', '.'), str(classifier._time_stamp), "log"]))
+
+    def add_classifier_process(self, classifier, run_classifier, process_name, logging_level=DEFAULT_LOGGER_LEVEL,
+                               logger_name=DEFAULT_LOGGER_NAME):
+        """Add the process of a classifier, or of one of its shards, to the multiprocessing queue, unless its output
+           is cached
+        Args:
+            classifier: The Classifier the process belongs to
+            run_classifier: The Classifier set up with the process' input and output, the classifier or its shard
+            process_name: Name of the process
+            logging_level: The logging level set for this command
+            logger_name: The name of the logger for this command
+        Raises:
+        Returns:
+        """
+        if self.cache is not None:
+            try:
+                cache_key = self.cache.key(run_classifier.input, run_classifier.cache_command(logger_name))
+            except (AttributeError, OSError, TypeError) as e:
+                logging_helper("Cannot hash " + process_name + " for the cache: " + str(e), logging_level="WARNING",
+                               logger_name=logger_name)
+            else:
+                if self.cache.fetch(cache_key, run_classifier.output):
+                    logging_helper("Skipping " + process_name + ", output found in cache.", logging_level="INFO",
+                                   logger_name=logger_name)
+                    return
+                self.process_cache_keys[process_name] = (cache_key, run_classifier.output)
+        logging_helper("New process: " + process_name.replace(":", " ") + ": \"" + " ".join(run_classifier.command) +
+                       "\"", logging_level="INFO", logger_name=logger_name)
+        cpus, memory, threads_option = run_classifier.resource_requirements(logging_level, logger_name)
+        self.run_process.add_process_to_workers(self.workers, self.queue, logging_level, logger_name,
+                                                run_classifier.command, process_name, cpus=cpus, memory=memory,
+                                                threads_option=threads_option,
+                                                log_path=self.process_log_path(run_classifier, process_name))
+        self.process_classifiers[process_name] = classifier
+
     def add_classifier_to_queue(self, classifier, logging_level=DEFAULT_LOGGER_LEVEL, logger_name=DEFAULT_LOGGER_NAME):
         """Add a classifier to this object, and it's multiprocessing queue
         Args:
@@ -207,10 +361,7 @@ class RunClassifiers(object):
         """
         if isinstance(classifier, Classifier) and classifier.command is not None:
             self.classifiers.append(classifier)
-            logging_helper("New process: " + classifier.name + ": \"" + " ".join(classifier.command) + "\"",
-                           logging_level="INFO", logger_name=logger_name)
-            self.run_process.add_process_to_workers(self.workers, self.queue, logging_level, logger_name,
-                                                    classifier.command, classifier.name)
+            self.add_classifier_process(classifier, classifier, classifier.name, logging_level, logger_name)
 
     def add_available_classifiers_to_queue(self, logging_level=DEFAULT_LOGGER_LEVEL, logger_name=DEFAULT_LOGGER_NAME):
         """Add all classifiers of this object to its multiprocessing queue
@@ -221,19 +372,134 @@ class RunClassifiers(object):
         Returns:
         """
         for classifier in self.classifiers:
-            logging_helper("New process: " + classifier.name + ": \"" + " ".join(classifier.command) + "\"",
-                           logging_level="INFO", logger_name=logger_name)
-            self.run_process.add_process_to_workers(self.workers, self.queue, logging_level, logger_name,
-                                                    classifier.command, classifier.name)
+            self.add_classifier_process(classifier, classifier, classifier.name, logging_level, logger_name)
+
+    def add_available_classifier_shards_to_queue(self, shard_paths, shard_folder, logging_level=DEFAULT_LOGGER_LEVEL,
+                                                 logger_name=DEFAULT_LOGGER_NAME):
+        """Add one process per query shard of every classifier of this object to its multiprocessing queue
+        Args:
+            shard_paths: Paths to the query shards
+            shard_folder: Folder where each shard gets an output folder of its own
+            logging_level: The logging level set for this command
+            logger_name: The name of the logger for this command
+        Raises:
+        Returns:
+        """
+        for classifier in self.classifiers:
+            shard_classifiers = []
+            for shard_path in shard_paths:
+                shard_name = os.path.splitext(os.path.basename(shard_path))[0]
+                shard_output = os.path.join(shard_folder, shard_name)
+                os.makedirs(shard_output, exist_ok=True)
+                shard_classifier = copy.copy(classifier)
+                shard_classifier.res = {}
+                shard_classifier.setup_classifier(shard_path, shard_output, classifier.config, classifier.name,
+                                                  logging_level=logging_level, logger_name=logger_name)
+                if shard_classifier.command is None:
+                    continue
+                self.add_classifier_process(classifier, shard_classifier, classifier.name + ":" + shard_name,
+                                            logging_level, logger_name)
+                shard_classifiers.append(shard_classifier)
+            self.shard_classifiers[classifier.name] = shard_classifiers
 
-    def run(self, logging_level=DEFAULT_LOGGER_LEVEL, logger_name=DEFAULT_LOGGER_NAME):
-        """Run all classifiers of this object
+    def merge_shards(self, logging_level=DEFAULT_LOGGER_LEVEL, logger_name=DEFAULT_LOGGER_NAME):
+        """Merge the shard outputs of every classifier into the output the classifier reads
         Args:
+            logging_level: The logging level set for this command
+            logger_name: The name of the logger for this command
         Raises:
         Returns:
         """
-        logging_helper("Running all available processes.", logging_level=logging_level, logger_name=logger_name)
-        self.run_process.run_all_worker_processes(self.workers, self.queue)
+        for classifier in self.classifiers:
+            self.merge_classifier_shards(classifier, logging_level, logger_name)
+
+    def merge_classifier_shards(self, classifier, logging_level=DEFAULT_LOGGER_LEVEL, logger_name=DEFAULT_LOGGER_NAME):
+        """Merge the shard outputs of a classifier into the output the classifier reads, if it was run on shards
+        Args:
+            classifier: A Classifier
+            logging_level: The logging level set for this command
+            logger_name: The name of the logger for this command
+        Raises:
+        Returns:
+        """
+        try:
+            shard_classifiers = self.shard_classifiers[classifier.name]
+        except KeyError:
+            return
+        classifier.merge_shard_outputs([shard_classifier.output for shard_classifier in shard_classifiers],
+                                       logging_level=logging_level, logger_name=logger_name)
+
+    def finish_classifier(self, classifier, read_results=False, logging_level=DEFAULT_LOGGER_LEVEL,
+                          logger_name=DEFAULT_LOGGER_NAME):
+        """Merge the shard outputs of a classifier whose processes all ended, and read its results
+        Args:
+            classifier: A Classifier
+            read_results: Boolean value to read the classifier results
+            logging_level: The logging level set for this command
+            logger_name: The name of the logger for this command
+        Raises: FileNotFoundError, TypeError
+        Returns:
+        """
+        self.merge_classifier_shards(classifier, logging_level, logger_name)
+        if read_results:
+            with get_metrics(logger_name).stage("read " + classifier.name) as record:
+                classifier.read_classifier_result(classifier.output, logging_level, logger_name)
+                record["queries"] = len(classifier.res)
+                record["hits"] = sum([len(hits) for hits in classifier.res.values()])
+
+    def run(self, logging_level=DEFAULT_LOGGER_LEVEL, logger_name=DEFAULT_LOGGER_NAME, max_processes=None,
+            max_cpus=None, max_memory=None, read_results=False):
+        """Run all classifiers of this object, each classifier is finished in a thread as soon as its last process
+           ends, while the others are still running
+        Args:
+            logging_level: The logging level set for this command
+            logger_name: The name of the logger for this command
+            max_processes: Maximum number of processes running at the same time, no limit if None or 0
+            max_cpus: CPUs the processes may use, all available CPUs if None or 0
+            max_memory: Memory in bytes the processes may use, all available memory if None or 0
+            read_results: Boolean value to read the classifier results once their processes end
+        Raises: FileNotFoundError, TypeError
+        Returns:
+        """
+        scheduler = ResourceScheduler(max_cpus, max_memory, max_processes, logger_name=logger_name)
+        logging_helper("Running all available processes with " + str(scheduler.max_cpus) + " CPUs and " +
+                       str(scheduler.max_memory) + " bytes of memory.", logging_level=logging_level,
+                       logger_name=logger_name)
+        # key: classifier name, val: number of its processes still running
+        unfinished = {}
+        for process_classifier in self.process_classifiers.values():
+            unfinished[process_classifier.name] = unfinished.get(process_classifier.name, 0) + 1
+        finished = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(self.classifiers), 1)) as executor:
+            # Classifiers whose outputs were all cached
+            for classifier in self.classifiers:
+                if classifier.name not in unfinished:
+                    finished[classifier.name] = executor.submit(self.finish_classifier, classifier, read_results,
+                                                                logging_level, logger_name)
+
+            def on_complete(worker):
+                try:
+                    classifier = self.process_classifiers[worker.process_name]
+                except KeyError:
+                    return
+                if self.cache is not None and worker.return_code == 0 and \
+                        worker.process_name in self.process_cache_keys:
+                    self.cache.store(*self.process_cache_keys[worker.process_name])
+                unfinished[classifier.name] -= 1
+                if unfinished[classifier.name] == 0:
+                    logging_helper("All processes of " + classifier.name + " ended, finishing it.",
+                                   logging_level=logging_level, logger_name=logger_name)
+                    finished[classifier.name] = executor.submit(self.finish_classifier, classifier, read_results,
+                                                                logging_level, logger_name)
+
+            self.run_process.run_all_worker_processes(self.workers, self.queue, scheduler=scheduler,
+                                                      on_complete=on_complete)
+            for classifier in self.classifiers:
+                if classifier.name not in finished:
+                    finished[classifier.name] = executor.submit(self.finish_classifier, classifier, read_results,
+                                                                logging_level, logger_name)
+            for classifier in self.classifiers:
+                finished[classifier.name].result()
 
     def res(self):
         """Get list of classifier results
@@ -272,29 +538,43 @@ class RunClassifiers(object):
 
 
 def run_available_classifiers(classifiers_to_run, list_of_classifiers, logging_level=DEFAULT_LOGGER_LEVEL,
-                              logger_name=DEFAULT_LOGGER_NAME):
+                              logger_name=DEFAULT_LOGGER_NAME, num_of_shards=1, shard_folder=None,
+                              max_processes=None, max_cpus=None, max_memory=None, log_folder=None, cache=None):
     """Placeholder function to read classifier results from output file path.
     Args:
         classifiers_to_run: List of the classifier names that will be run
         list_of_classifiers: List of the classifier classes
         logging_level: The logging level set for this command
         logger_name: The name of the logger for this command
+        num_of_shards: Number of query shards each classifier runs on, the whole query is used if 1
+        shard_folder: Folder for the query shards and their outputs
+        max_processes: Maximum number of processes running at the same time, no limit if None or 0
+        max_cpus: CPUs the processes may use, all available CPUs if None or 0
+        max_memory: Memory in bytes the processes may use, all available memory if None or 0
+        log_folder: Folder the output of the classifier processes is written to, the output folders if None
+        cache: ClassifierCache the classifier outputs are looked up in and stored to, not used if None
     Raises:
     Returns:
         list of classifiers that were run, list of classifiers that were skipped
     """
-    run_cls = RunClassifiers()
+    run_cls = RunClassifiers(log_folder=log_folder, cache=cache)
     skipped_classifiers = []
     for idx, cls in enumerate(list_of_classifiers):
         if isinstance(cls, Classifier) and cls.command is not None and cls.name in classifiers_to_run:
             run_cls.add_classifier(cls)
         else:
             skipped_classifiers.append(classifiers_to_run[idx])
-    run_cls.add_available_classifiers_to_queue(logging_level, logger_name)
-    run_cls.run(logging_level, logger_name)
-    for cls in run_cls.classifiers:
-        cls_output = cls.output
-        cls.read_classifier_result(cls_output, logging_level, logger_name)
+    if num_of_shards is not None and num_of_shards > 1 and len(run_cls.classifiers) > 0:
+        query_path = run_cls.classifiers[0].input
+        if shard_folder is None:
+            shard_folder = os.path.dirname(run_cls.classifiers[0].output)
+        shard_folder = os.path.join(shard_folder, "shards")
+        os.makedirs(shard_folder, exist_ok=True)
+        shard_paths = split_fasta(query_path, shard_folder, num_of_shards, logger_name=logger_name)
+        run_cls.add_available_classifier_shards_to_queue(shard_paths, shard_folder, logging_level, logger_name)
+    else:
+        run_cls.add_available_classifiers_to_queue(logging_level, logger_name)
+    run_cls.run(logging_level, logger_name, max_processes=max_processes, max_cpus=max_cpus, max_memory=max_memory,
+                read_results=True)
 
     return run_cls.classifiers, skipped_classifiers
-
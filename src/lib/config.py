@@ -2,15 +2,26 @@ import configparser
 import os
 from argparse import ArgumentParser
 
-from src.definitions import ROOT_DIR, DEFAULT_LOGGER_NAME, DEFAULT_CONFIG_PATH, CLASSIFIERS_CLS_DIR, WEIGHTS_DIR, ENSEMBLES_CLS_DIR, MAPS_DIR
-from src.lib.process import logging_helper, load_module_function_from_path
+from src.definitions import ROOT_DIR, DEFAULT_LOGGER_NAME, DEFAULT_CONFIG_PATH, CLASSIFIERS_CLS_DIR, WEIGHTS_DIR, ENSEMBLES_CLS_DIR, MAPS_DIR, \
+    DEFAULT_SHARDS, DEFAULT_PROCESSES, DEFAULT_MAX_CPUS, DEFAULT_MAX_MEMORY, \
+    DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+from src.lib.process import logging_helper, load_module_function_from_path, parse_memory
 
 
 _DEFAULT_SECTIONS = ["Mapping", "Ensembles", "Classifiers"]
+# Options of the optional [Pipeline] section, with their types and defaults
+_PIPELINE_OPTIONS = {
+    "shards": (int, DEFAULT_SHARDS),
+    "processes": (int, DEFAULT_PROCESSES),
+    "max_cpus": (int, DEFAULT_MAX_CPUS),
+    "max_memory": (parse_memory, DEFAULT_MAX_MEMORY),
+    "cache_dir": (str, DEFAULT_CACHE_DIR),
+    "cache_size": (parse_memory, DEFAULT_CACHE_SIZE)
+}
 
 
 def get_options_from_config_section(config, section_name, name_only=True, selected_options=None,
-                                    logging_level="WARNING", logger_name=DEFAULT_LOGGER_NAME):
+                                    logging_level="WARNING", logger_name=DEFAULT_LOGGER_NAME, raw=False):
     """Helper function to retrieve options from a configparser section
     Args:
         config: configparser
@@ -19,6 +30,7 @@ def get_options_from_config_section(config, section_name, name_only=True, select
         selected_options: specific options to retrieve
         logging_level: The logging level set for read map
         logger_name: The name of the logger for read map
+        raw: Boolean value to skip interpolation
     Raises:
     Returns:
         option names or options with their items
@@ -31,7 +43,7 @@ def get_options_from_config_section(config, section_name, name_only=True, select
         return None
     try:
         try:
-            section_options = config.items(section_name)
+            section_options = config.items(section_name, raw=raw)
         except configparser.InterpolationMissingOptionError:
             section_options = config.items(section_name, raw=True)
         section_options_names = [tup[0] for tup in section_options]
@@ -82,7 +94,7 @@ def get_values_from_config_option(config, section_name, option_name, logging_lev
 
 
 def config_section_to_multi_sections_helper(config, section_name, selected_options=None,
-                                            logging_level="WARNING", logger_name=DEFAULT_LOGGER_NAME):
+                                            logging_level="WARNING", logger_name=DEFAULT_LOGGER_NAME, raw=False):
     """Helper function for a section that points to multiple sections, i.e. Ensembles & Classifiers
     Args:
         config: configparser
@@ -90,6 +102,7 @@ def config_section_to_multi_sections_helper(config, section_name, selected_optio
         selected_options: Name of the options to retrieve
         logging_level: The logging level set for read map
         logger_name: The name of the logger for read map
+        raw: Boolean value to skip interpolation of the referenced sections
     Raises:
     Returns:
         sections_names: names of the referenced multiple sections
@@ -105,7 +118,7 @@ def config_section_to_multi_sections_helper(config, section_name, selected_optio
         available_sections_names = None
     if available_sections_names is not None:
         available_sections_dicts = [get_options_from_config_section(config, section, selected_options=selected_options,
-                                                                    name_only=False)
+                                                                    name_only=False, raw=raw)
                                     for section in available_sections_names]
     else:
         available_sections_dicts = None
@@ -232,7 +245,20 @@ def read_config_ini(timestamp, config_ini, io_dict, overwrites=None, logging_lev
     return classifier_sections, list_of_classifiers, ensemble_sections, list_of_ensembles, mapping_files
 
 
-def read_config(config_ini, io_dict=None, overwrites=None, logging_level="DEBUG", logger_name=DEFAULT_LOGGER_NAME):
+def read_config(config_ini, io_dict=None, overwrites=None, logging_level="DEBUG", logger_name=DEFAULT_LOGGER_NAME,
+                raw=False):
+    """Read in the mapping, classifier and ensemble sections of config.ini
+    Args:
+        config_ini: Path to config.ini
+        io_dict: Dictionary that represents an "IO" section for the configparser
+        overwrites: A dictionary to overwrite values of the config.ini
+        logging_level: The logging level set for read config
+        logger_name: The name of the logger for read config
+        raw: Boolean value to keep the classifier and ensemble options uninterpolated, i.e. as command templates
+    Raises: SystemError
+    Returns:
+        mapping_dict, classifier_dict, ensemble_dict
+    """
     logging_helper("Processing config.ini", logging_level, logger_name)
     if not os.path.isfile(config_ini):
         logging_helper("Cannot find 'config.ini' at path %s." % config_ini, logging_level="ERROR",
@@ -255,7 +281,7 @@ def read_config(config_ini, io_dict=None, overwrites=None, logging_level="DEBUG"
         mapping_dict.setdefault(map_option, map_value)
 
     classifier_dict = {}
-    classifier_sections = config_section_to_multi_sections_helper(pipeline_config, "Classifiers")
+    classifier_sections = config_section_to_multi_sections_helper(pipeline_config, "Classifiers", raw=raw)
     if classifier_sections is None:
         logging_helper("No [Classifiers] section in config.ini", "ERROR", logger_name)
         raise SystemError
@@ -264,7 +290,7 @@ def read_config(config_ini, io_dict=None, overwrites=None, logging_level="DEBUG"
         classifier_dict.setdefault(classifier_sections[0][idx], classifier_sections[1][idx])
 
     ensemble_dict = {}
-    ensemble_sections = config_section_to_multi_sections_helper(pipeline_config, "Ensembles")
+    ensemble_sections = config_section_to_multi_sections_helper(pipeline_config, "Ensembles", raw=raw)
     if ensemble_sections is None:
         logging_helper("No [Ensembles] section in config.ini", "ERROR", logger_name)
         raise SystemError
@@ -274,3 +300,33 @@ def read_config(config_ini, io_dict=None, overwrites=None, logging_level="DEBUG"
 
     return mapping_dict, classifier_dict, ensemble_dict
 
+
+def read_pipeline_options(config_ini, overwrites=None, logger_name=DEFAULT_LOGGER_NAME):
+    """Read in the optional [Pipeline] section of config.ini
+    Args:
+        config_ini: Path to config.ini
+        overwrites: A dictionary to overwrite values of the config.ini
+        logger_name: The name of the logger
+    Raises:
+    Returns:
+        pipeline_options: Dictionary of the pipeline options, with defaults for missing or invalid values
+    """
+    pipeline_config = configparser.ConfigParser(allow_no_value=True, interpolation=configparser.ExtendedInterpolation())
+    if os.path.isfile(config_ini):
+        pipeline_config.read(config_ini)
+    if overwrites is not None and type(overwrites) is dict:
+        pipeline_config.read_dict(overwrites)
+    pipeline_options = {}
+    for option, (option_type, option_default) in _PIPELINE_OPTIONS.items():
+        pipeline_options[option] = option_default
+        if not pipeline_config.has_option("Pipeline", option):
+            continue
+        option_val = get_values_from_config_option(pipeline_config, "Pipeline", option, logger_name=logger_name)
+        if option_val is None:
+            continue
+        try:
+            pipeline_options[option] = option_type(option_val)
+        except (TypeError, ValueError):
+            logging_helper("Invalid value '" + str(option_val) + "' for '" + option + "' in [Pipeline], using default " +
+                           str(option_default) + ".", logging_level="WARNING", logger_name=logger_name)
+    return pipeline_options
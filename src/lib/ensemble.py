@@ -2,6 +2,7 @@ import random
 
 from src.definitions import DEFAULT_LOGGER_LEVEL, DEFAULT_LOGGER_NAME
 from src.lib.classifier import Classifier, FunctionClass
+from src.lib.metrics import get_metrics
 from src.lib.process import logging_helper
 
 
@@ -140,7 +141,10 @@ def run_all_ensembles(list_of_ensemble_names, list_of_ensemble_cls, queries=None
             if isinstance(ensemble_cls, Ensemble):
                 logging_helper("Performing Ensemble: %s." % list_of_ensemble_names[idx], logging_level="INFO",
                                logger_name=logger_name)
-                ensemble_cls.run(queries=queries)
+                with get_metrics(logger_name).stage("ensemble " + list_of_ensemble_names[idx]) as record:
+                    ensemble_cls.run(queries=queries)
+                    record["queries"] = len(ensemble_cls.prediction.res)
+                    record["hits"] = sum([len(hits) for hits in ensemble_cls.prediction.res.values()])
                 ensembles_ran.append(ensemble_cls)
             else:
                 skipped_ensembles.append(list_of_ensemble_names[idx])
@@ -0,0 +1,170 @@
+import contextlib
+import json
+import os
+import resource
+import threading
+import time
+from datetime import datetime
+
+from src.definitions import DEFAULT_LOGGER_NAME
+
+# key: name, val: RunMetrics, shared the same way loggers are shared by name
+_run_metrics = {}
+_run_metrics_lock = threading.Lock()
+
+
+def get_metrics(name=DEFAULT_LOGGER_NAME):
+    """Get the RunMetrics of a name, created on first use
+    Args:
+        name: Name of the run metrics, the logger name of the run
+    Raises:
+    Returns:
+        RunMetrics
+    """
+    with _run_metrics_lock:
+        try:
+            return _run_metrics[name]
+        except KeyError:
+            return _run_metrics.setdefault(name, RunMetrics(name))
+
+
+def read_proc_io():
+    """Bytes read and written by this process, from /proc/self/io where present
+    Args:
+    Raises:
+    Returns:
+        Bytes read, bytes written
+    """
+    read_bytes, write_bytes = 0, 0
+    try:
+        with open('/proc/self/io', 'r') as fp:
+            for line in fp:
+                key, _, val = line.partition(':')
+                if key == 'rchar':
+                    read_bytes = int(val)
+                elif key == 'wchar':
+                    write_bytes = int(val)
+    except (OSError, ValueError):
+        pass
+    return read_bytes, write_bytes
+
+
+def _snapshot():
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    read_bytes, write_bytes = read_proc_io()
+    return {
+        "wall": time.perf_counter(),
+        "thread_cpu": time.thread_time(),
+        "process_cpu": self_usage.ru_utime + self_usage.ru_stime,
+        "children_cpu": children_usage.ru_utime + children_usage.ru_stime,
+        "max_rss": self_usage.ru_maxrss,
+        "children_max_rss": children_usage.ru_maxrss,
+        "read_bytes": read_bytes,
+        "write_bytes": write_bytes
+    }
+
+
+class RunMetrics(object):
+    """Wall time, CPU time, peak memory and I/O of the stages of a run
+    """
+    def __init__(self, name=DEFAULT_LOGGER_NAME):
+        """Initialize class
+        Args:
+            name: Name of the run metrics
+        """
+        self.name = name
+        self.started = datetime.now()
+        self._start = _snapshot()
+        self._lock = threading.Lock()
+        self.stages = []
+
+    def __repr__(self):
+        return f'RunMetrics(\'{self.name}\', {len(self.stages)})'
+
+    @contextlib.contextmanager
+    def stage(self, stage_name, **counts):
+        """Measure a stage of the run. CPU time is the time of the calling thread, CPU time and peak memory of
+           child processes count processes that ended during the stage, bytes read and written are the whole process'.
+           Counts, i.e. queries and hits, can be given or set on the yielded dictionary.
+        Args:
+            stage_name: Name of the stage
+            counts: Counts of the stage
+        Raises:
+        Returns:
+            Dictionary of the stage's record
+        """
+        record = {"stage": stage_name}
+        record.update(counts)
+        start = _snapshot()
+        try:
+            yield record
+        finally:
+            end = _snapshot()
+            record.update({
+                "wall_time": end["wall"] - start["wall"],
+                "cpu_time": end["thread_cpu"] - start["thread_cpu"],
+                "children_cpu_time": end["children_cpu"] - start["children_cpu"],
+                "max_rss_kb": end["max_rss"],
+                "children_max_rss_kb": end["children_max_rss"],
+                "read_bytes": end["read_bytes"] - start["read_bytes"],
+                "write_bytes": end["write_bytes"] - start["write_bytes"]
+            })
+            self.add(record)
+
+    def add(self, record):
+        """Add the record of a stage measured elsewhere, i.e. in a worker process
+        Args:
+            record: Dictionary with at least a "stage" key
+        Raises:
+        Returns:
+        """
+        with self._lock:
+            self.stages.append(record)
+
+    def report(self):
+        """Metrics of the run so far
+        Args:
+        Raises:
+        Returns:
+            Dictionary of the run metrics
+        """
+        end = _snapshot()
+        with self._lock:
+            stages = list(self.stages)
+        return {
+            "name": self.name,
+            "started": self.started.isoformat(),
+            "wall_time": end["wall"] - self._start["wall"],
+            "cpu_time": end["process_cpu"] - self._start["process_cpu"],
+            "children_cpu_time": end["children_cpu"] - self._start["children_cpu"],
+            "max_rss_kb": end["max_rss"],
+            "children_max_rss_kb": end["children_max_rss"],
+            "read_bytes": end["read_bytes"] - self._start["read_bytes"],
+            "write_bytes": end["write_bytes"] - self._start["write_bytes"],
+            "stages": stages
+        }
+
+    def reset(self):
+        """Start the run metrics over, i.e. between the job batches of a server. Stages of batches running at the
+           same time are recorded together.
+        Args:
+        Raises:
+        Returns:
+        """
+        with self._lock:
+            self.started = datetime.now()
+            self._start = _snapshot()
+            self.stages = []
+
+    def write_json(self, output_path):
+        """Write the run metrics as JSON
+        Args:
+            output_path: Path to the JSON file
+        Raises: OSError
+        Returns:
+        """
+        os.makedirs(os.path.dirname(os.path.realpath(output_path)), exist_ok=True)
+        with open(output_path, 'w') as op:
+            json.dump(self.report(), op, indent=2)
+            op.write('\n')
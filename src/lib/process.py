@@ -2,14 +2,25 @@ import logging
 import logging.config
 import logging.handlers
 import multiprocessing
+import multiprocessing.connection
 import os
+import queue
+import resource
 import subprocess
 import sys
+import tempfile
 import threading
+import time
 from argparse import ArgumentTypeError
 from importlib import util
 
 from src.definitions import DEFAULT_LOGGER_NAME, DEFAULT_LOGGER_LEVEL
+from src.lib.metrics import get_metrics
+
+# Bytes from the end of a process' output kept for error reporting
+_OUTPUT_TAIL_BYTES = 64 * 1024
+# key: real path of a module file, val: module loaded by load_module_function_from_path
+_loaded_modules = {}
 
 logging_levels = {
     "DEBUG": logging.DEBUG,
@@ -92,6 +103,170 @@ class LoggerConfig(object):
         self.dictConfig['loggers'].setdefault(logger_name, new_logger)
 
 
+def available_cpus():
+    """Number of CPUs this process may run on
+    Args:
+    Raises:
+    Returns:
+        Number of CPUs
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def available_memory():
+    """Memory available on the node in bytes, "MemAvailable" of /proc/meminfo where present
+    Args:
+    Raises:
+    Returns:
+        Available memory in bytes
+    """
+    try:
+        with open('/proc/meminfo', 'r') as fp:
+            for line in fp:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def parse_memory(memory_string):
+    """Convert a memory amount such as "512M" or "8G" to bytes, numbers without a unit are megabytes
+    Args:
+        memory_string: Memory amount with an optional K, M, G or T unit
+    Raises: ValueError
+    Returns:
+        Memory in bytes
+    """
+    if memory_string is None:
+        return 0
+    memory_string = str(memory_string).strip().upper().rstrip('B')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    if len(memory_string) > 0 and memory_string[-1] in units:
+        return int(float(memory_string[:-1]) * units[memory_string[-1]])
+    return int(float(memory_string) * units['M'])
+
+
+class ProcessJob(object):
+    """A command run by a worker process, with the resources it needs
+    """
+    def __init__(self, cmd, process_name="Process", logging_level=DEFAULT_LOGGER_LEVEL,
+                 logger_name=DEFAULT_LOGGER_NAME, cpus=1, memory=0, threads_option=None, log_path=None):
+        """Initialize class
+        Args:
+            cmd: A string list of the command
+            process_name: Name of the process
+            logging_level: The logging level set for this command
+            logger_name: The name of the logger for this command
+            cpus: Number of CPUs the command uses
+            memory: Memory the command uses, in bytes
+            threads_option: Command option that sets the number of threads, i.e. "-num_threads"
+            log_path: File the command's stdout and stderr are written to, discarded if None
+        """
+        self.cmd = list(cmd)
+        self.process_name = process_name
+        self.logging_level = logging_level
+        self.logger_name = logger_name
+        self.cpus = max(int(cpus), 1)
+        self.memory = max(int(memory), 0)
+        self.threads_option = threads_option
+        self.log_path = log_path
+        # CPUs given by the scheduler
+        self.granted_cpus = self.cpus
+        self.process = None
+        # Exit code of the command, set once the worker ends
+        self.return_code = None
+
+    def __repr__(self):
+        return f'ProcessJob(\'{self.process_name}\', {self.cpus}, {self.memory})'
+
+    def command(self):
+        """Command with its thread count set to the granted CPUs
+        Args:
+        Raises:
+        Returns:
+            A string list of the command
+        """
+        cmd = list(self.cmd)
+        if self.threads_option is not None and self.threads_option in cmd[:-1]:
+            cmd[cmd.index(self.threads_option) + 1] = str(self.granted_cpus)
+        return cmd
+
+
+class ResourceScheduler(object):
+    """Object that admits jobs only while their CPU and memory requirements fit the node's limits
+    """
+    def __init__(self, max_cpus=None, max_memory=None, max_processes=None, logger_name=DEFAULT_LOGGER_NAME):
+        """Initialize class
+        Args:
+            max_cpus: CPUs that can be used, all available CPUs if None or 0
+            max_memory: Memory in bytes that can be used, all available memory if None or 0
+            max_processes: Maximum number of jobs running at the same time, no limit if None or 0
+            logger_name: The name of the logger
+        """
+        self.max_cpus = max_cpus or available_cpus()
+        self.max_memory = max_memory or available_memory()
+        self.max_processes = max_processes or None
+        self.logger_name = logger_name
+        self.used_cpus = 0
+        self.used_memory = 0
+        self.running = []
+
+    def __repr__(self):
+        return f'ResourceScheduler({self.max_cpus}, {self.max_memory}, {self.max_processes})'
+
+    def admit(self, job):
+        """Reserve resources for a job if it fits, jobs with a threads option are shrunk to the free CPUs
+        Args:
+            job: ProcessJob
+        Raises:
+        Returns:
+            True if the job was admitted
+        """
+        if self.max_processes is not None and len(self.running) >= self.max_processes:
+            return False
+        free_cpus = self.max_cpus - self.used_cpus
+        free_memory = self.max_memory - self.used_memory
+        if len(self.running) == 0:
+            # A job that can never fit still runs, on its own
+            if job.memory > self.max_memory > 0:
+                logging_helper(job.process_name + " needs more memory than the limit of " + str(self.max_memory) +
+                               " bytes, running it alone.", logging_level="WARNING", logger_name=self.logger_name)
+            free_memory = max(free_memory, job.memory)
+            if job.threads_option is None:
+                free_cpus = max(free_cpus, job.cpus)
+        if job.memory > free_memory or free_cpus < 1:
+            return False
+        if job.cpus <= free_cpus:
+            job.granted_cpus = job.cpus
+        elif job.threads_option is not None:
+            job.granted_cpus = free_cpus
+        else:
+            return False
+        self.used_cpus += job.granted_cpus
+        self.used_memory += job.memory
+        self.running.append(job)
+        return True
+
+    def release(self, job):
+        """Free the resources of a finished job
+        Args:
+            job: ProcessJob
+        Raises:
+        Returns:
+        """
+        if job in self.running:
+            self.running.remove(job)
+            self.used_cpus -= job.granted_cpus
+            self.used_memory -= job.memory
+
+
 class RunProcess(object):
     """Object for running processes
     """
@@ -114,14 +289,35 @@ class RunProcess(object):
             logger = logging.getLogger(record.name)
             logger.handle(record)
 
-    def _worker_process(self, mpq, logging_level, logger_name, cmd, process_name="Process"):
-        """Worker process to run a command, puts process result in a queue
+    @staticmethod
+    def _read_output_tail(fp, tail_bytes=_OUTPUT_TAIL_BYTES):
+        """Read the last lines of a process' output, at most tail_bytes
+        Args:
+            fp: Binary file object of the output
+            tail_bytes: Maximum number of bytes read
+        Raises:
+        Returns:
+            The last lines of the output
+        """
+        fp.seek(0, os.SEEK_END)
+        size = fp.tell()
+        fp.seek(max(size - tail_bytes, 0))
+        tail = fp.read()
+        if size > tail_bytes:
+            # Drop the partial first line
+            tail = tail.partition(b'\n')[2]
+        return str(tail.strip(), "utf-8", errors="replace")
+
+    def _worker_process(self, mpq, logging_level, logger_name, cmd, process_name="Process", log_path=None):
+        """Worker process to run a command, streaming its output to a log file, puts the exit code, the tail of the
+           output and the run time and resource usage in a queue
         Args:
             mpq: A multiprocessing Queue
             logging_level: The logging level set for this command
             logger_name: The name of the logger for this command
             cmd: A list for the command
             process_name: Name of the process
+            log_path: File the command's stdout and stderr are written to, discarded if None
         Raises:
         Returns:
         """
@@ -129,24 +325,31 @@ class RunProcess(object):
         root = logging.getLogger()
         root.setLevel(logging.DEBUG)
         root.addHandler(qh)
-        try:
-            command_list = []
-            # Clean up command list
-            for i in cmd:
-                command_list += i.split()
-            call_output = subprocess.check_output(command_list, stderr=subprocess.STDOUT)
-        except subprocess.CalledProcessError as exc:
-            self.mp_queue.put(
-                (' '.join(cmd), logging_level, logger_name, exc.returncode, str(exc.output.strip(), "utf-8"),
-                 process_name))
-        except FileNotFoundError as e:
-            self.mp_queue.put(
-                (' '.join(cmd), logging_level, logger_name, e.errno, e.strerror, process_name))
+        command_list = []
+        # Clean up command list
+        for i in cmd:
+            command_list += i.split()
+        start_time = time.perf_counter()
+        if log_path is None:
+            log_fp = tempfile.TemporaryFile()
         else:
-            self.mp_queue.put(
-                (' '.join(cmd), logging_level, logger_name, 0, str(call_output.strip(), "utf-8"), process_name))
+            log_fp = open(log_path, 'w+b')
+        with log_fp:
+            try:
+                return_code = subprocess.call(command_list, stdout=log_fp, stderr=subprocess.STDOUT)
+                output = self._read_output_tail(log_fp)
+            except FileNotFoundError as e:
+                return_code, output = e.errno, e.strerror
+                log_fp.write(bytes(output, "utf-8"))
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.mp_queue.put(
+            (' '.join(cmd), logging_level, logger_name, return_code, output, process_name,
+             {"wall_time": time.perf_counter() - start_time, "user_time": usage.ru_utime,
+              "system_time": usage.ru_stime, "max_rss": usage.ru_maxrss, "read_bytes": usage.ru_inblock * 512,
+              "write_bytes": usage.ru_oublock * 512, "log": log_path}))
 
-    def add_process_to_workers(self, workers, mpq, logging_level, logger_name, cmd, process_name="Process"):
+    def add_process_to_workers(self, workers, mpq, logging_level, logger_name, cmd, process_name="Process",
+                               cpus=1, memory=0, threads_option=None, log_path=None):
         """Add a worker process to the workers
         Args:
             workers: List of workers
@@ -155,59 +358,126 @@ class RunProcess(object):
             logger_name: The name of the logger for this command
             cmd: A string list of the command
             process_name: Name of the process
+            cpus: Number of CPUs the command uses
+            memory: Memory the command uses, in bytes
+            threads_option: Command option that sets the number of threads, i.e. "-num_threads"
+            log_path: File the command's stdout and stderr are written to, discarded if None
         Raises:
         Returns:
         """
-        wp = multiprocessing.Process(target=self._worker_process,
-                                     args=(mpq, logging_level, logger_name, cmd, process_name,))
-        workers.append((wp, ' '.join(cmd), logging_level, logger_name, process_name))
+        workers.append(ProcessJob(cmd, process_name, logging_level, logger_name, cpus=cpus, memory=memory,
+                                  threads_option=threads_option, log_path=log_path))
+
+    def _collect_worker_results(self, results):
+        """Move all results that are currently in the result queue into a list
+        Args:
+            results: List of worker results
+        Raises:
+        Returns:
+        """
+        while True:
+            try:
+                results.append(self.mp_queue.get_nowait())
+            except queue.Empty:
+                break
+
+    def _start_worker(self, worker, mpq):
+        cmd = worker.command()
+        worker.process = multiprocessing.Process(
+            target=self._worker_process, args=(mpq, worker.logging_level, worker.logger_name, cmd,
+                                               worker.process_name, worker.log_path,))
+        worker.process.daemon = True
+        worker.process.start()
+        logging_helper("Starting Process \"" + ' '.join(cmd) + "\" with " + str(worker.granted_cpus) + " CPUs",
+                       logging_level=worker.logging_level, logger_name=worker.logger_name)
 
-    def run_all_worker_processes(self, workers, mpq):
-        """add a worker process to the workers
+    def run_all_worker_processes(self, workers, mpq, max_processes=None, scheduler=None, on_complete=None):
+        """Run the worker processes, starting each one once the scheduler has resources for it
         Args:
             workers: List of workers
             mpq: A multiprocessing Queue
+            max_processes: Maximum number of workers running at the same time, no limit if None or 0
+            scheduler: ResourceScheduler, one using all of the node is created if None
+            on_complete: Function called with each worker as soon as it exits, in the order they finish
         Raises:
         Returns:
         """
-        for worker in workers:
-            worker[0].daemon = True
-            worker[0].start()
-            logging_helper("Starting Process \"" + worker[1] + "\"", logging_level=worker[2],
-                           logger_name=worker[3])
+        if scheduler is None:
+            scheduler = ResourceScheduler(max_processes=max_processes)
+        elif max_processes:
+            scheduler.max_processes = max_processes
         lp = threading.Thread(target=self._logger_thread, args=(mpq,))
         lp.start()
-        # Main process waiting for workers terminate
+        pending = list(workers)
+        running = []
+        results = []
+        # Main process starting workers as resources free up, and waiting for workers terminate
         try:
-            for worker in workers:
-                worker[0].join()
+            while len(pending) > 0 or len(running) > 0:
+                for worker in list(pending):
+                    if scheduler.admit(worker):
+                        pending.remove(worker)
+                        self._start_worker(worker, mpq)
+                        running.append(worker)
+                # Results are drained while waiting, workers cannot exit before their result is read
+                multiprocessing.connection.wait([worker.process.sentinel for worker in running], timeout=0.1)
+                self._collect_worker_results(results)
+                for worker in [worker for worker in running if not worker.process.is_alive()]:
+                    worker.process.join()
+                    running.remove(worker)
+                    scheduler.release(worker)
+                    self._collect_worker_results(results)
+                    for result in results:
+                        if result[5] == worker.process_name:
+                            worker.return_code = result[3]
+                    if on_complete is not None:
+                        on_complete(worker)
+            self._collect_worker_results(results)
             # Finish logging
             mpq.put(None)
             lp.join()
         except KeyboardInterrupt:
             for worker in workers:
-                worker[0].terminate()
+                if worker.process is not None and worker.process.is_alive():
+                    worker.process.terminate()
             mpq.put(None)
             lp.join()
             logger = logging.getLogger()
             logger.log(logging.ERROR, "Program interrupted, exiting...")
             sys.exit(1)
-        # Retrieve stdout of all queued workers
-        for i in range(len(workers)):
-            cmd, logging_level, logger_name, return_code, output, process_name = (self.mp_queue.get())
+        # Workers that died without a result, i.e. killed
+        finished_names = set([result[5] for result in results])
+        for worker in workers:
+            if worker.process_name not in finished_names:
+                results.append((' '.join(worker.command()), worker.logging_level, worker.logger_name,
+                                worker.process.exitcode, "Process exited without a result", worker.process_name,
+                                {"log": worker.log_path}))
+        # Report the exit code and run time of all queued workers, and the output tail of failed ones
+        for cmd, logging_level, logger_name, return_code, output, process_name, stats in results:
             self.run_results.append((cmd, return_code, output))
+            get_metrics(logger_name).add({
+                "stage": "process " + process_name, "return_code": return_code,
+                "wall_time": stats.get("wall_time"),
+                "cpu_time": stats.get("user_time", 0) + stats.get("system_time", 0) if "user_time" in stats else None,
+                "max_rss_kb": stats.get("max_rss"), "read_bytes": stats.get("read_bytes"),
+                "write_bytes": stats.get("write_bytes")})
+            try:
+                logging_helper("%s Ended with exit code %s in %.2fs (user %.2fs, system %.2fs, max RSS %d KB), "
+                               "output in \"%s\"" % (process_name, str(return_code), stats["wall_time"],
+                                                      stats["user_time"], stats["system_time"], stats["max_rss"],
+                                                      str(stats["log"])),
+                               logging_level=logging_level, logger_name=logger_name)
+            except KeyError:
+                logging_helper(process_name + " Ended with exit code " + str(return_code),
+                               logging_level=logging_level, logger_name=logger_name)
             if return_code != 0:
                 for index, line in enumerate(output.split('\n')):
                     logging_helper("Process Error \"" + cmd + "\", stdout[" + str(index) + "]: " + line,
                                    logging_level="ERROR", logger_name=logger_name)
-            else:
-                for index, line in enumerate(output.split('\n')):
-                    logging_helper(process_name + " Ended, stdout[" + str(index) + "]: " + line,
-                                   logging_level=logging_level, logger_name=logger_name)
 
 
 def load_module_function_from_path(module_path, function_name, module_name=None):
-    """Load in function from a module file path
+    """Load in function from a module file path, each module file is only executed once
     Args:
         module_path: File path to module's '.py' file
         function_name: The name of the function to load in
@@ -218,10 +488,14 @@ def load_module_function_from_path(module_path, function_name, module_name=None)
     """
     if module_name is None:
         module_name = os.path.basename(os.path.dirname(module_path))
-    spec = util.spec_from_file_location(module_name, module_path)
-    mod = util.module_from_spec(spec)
-    sys.modules[module_name] = mod
-    spec.loader.exec_module(mod)
+    try:
+        mod = _loaded_modules[os.path.realpath(module_path)]
+    except KeyError:
+        spec = util.spec_from_file_location(module_name, module_path)
+        mod = util.module_from_spec(spec)
+        sys.modules[module_name] = mod
+        spec.loader.exec_module(mod)
+        _loaded_modules[os.path.realpath(module_path)] = mod
     fn = mod and getattr(mod, function_name, None)
     return fn
 
@@ -1,10 +1,18 @@
+import hashlib
+import io
 import logging
+import mmap
 import os
 import re
+from array import array
 
-from src.definitions import DEFAULT_LOGGER_NAME, DEFAULT_LOGGER_LEVEL, DEFAULT_PTOOLS_CHAR_LIMIT
+from src.definitions import DEFAULT_LOGGER_NAME, DEFAULT_LOGGER_LEVEL, DEFAULT_PTOOLS_CHAR_LIMIT, \
+    FASTA_INDEX_FORMAT, FASTA_INDEX_SUFFIX
 from src.lib.process import logging_helper
 
+# key: (file stat key, key index, value index), val: mapping dictionary read by load_e2p2_map
+_e2p2_map_cache = {}
+
 
 def read_delim_itr(fp, key_idx=0, val_indices=None, delim=None, skip=None):
     """Iterator to read delimited files
@@ -62,6 +70,28 @@ def read_e2p2_maps(ef_map_path, key_idx=0, val_idx=1, logging_level=DEFAULT_LOGG
     return map_dict
 
 
+def load_e2p2_map(ef_map_path, key_idx=0, val_idx=1, logging_level=DEFAULT_LOGGER_LEVEL,
+                  logger_name=DEFAULT_LOGGER_NAME):
+    """Read in a mapping file of E2P2 once, later calls on the unchanged file return the same dictionary,
+       which must not be modified
+    Args:
+        ef_map_path: Path to an E2P2 mapping file
+        key_idx: Index of the key
+        val_idx: Index of the value
+        logging_level: The logging level set for read map
+        logger_name: The name of the logger for read map
+    Raises: OSError
+    Returns:
+        map_dict: Key to value of the E2P2 map
+    """
+    map_key = (_fasta_stat_key(ef_map_path), key_idx, val_idx)
+    try:
+        return _e2p2_map_cache[map_key]
+    except KeyError:
+        return _e2p2_map_cache.setdefault(map_key, read_e2p2_maps(ef_map_path, key_idx, val_idx, logging_level,
+                                                                  logger_name))
+
+
 def read_groups_by_start_itr(fp, start=None, skip=None):
     """Iterator to group file strings by their starting string
     Args:
@@ -112,37 +142,424 @@ def read_fasta(fp):
         yield header, '\n'.join(seq)
 
 
+def fasta_header_id(header):
+    """Get the sequence ID of a fasta header
+    Args:
+        header: fasta header, including the leading '>'
+    Raises: IndexError
+    Returns:
+        header_id: The sequence ID
+    """
+    header_info = re.split(r'[\s|]+', header)
+    return header_info[0].replace('>', '', 1)
+
+
+def scan_fasta_records(fp):
+    """Iterator for scanning a fasta file opened in binary mode, without keeping the sequences
+    Args:
+        fp: file pointer to fasta file, opened with 'rb'
+    Raises:
+    Yields:
+        header: fasta header
+        offset: Byte offset of the header line
+        seq_offset: Byte offset of the first sequence line
+        end: Byte offset right after the last line of the record
+        residues: Number of characters in the stripped sequence lines
+        line_count: Number of sequence lines
+        line_bases: Residues per line, 0 if the lines are not of equal length
+        line_width: Bytes per line including the line end, 0 if the lines are not of equal length
+    """
+    header = None
+    offset, seq_offset, end, residues, line_count, line_bases, line_width, last_width = 0, 0, 0, 0, 0, 0, 0, 0
+    for line in fp:
+        if line.startswith(b'>'):
+            if header is not None:
+                yield header, offset, seq_offset, end, residues, line_count, line_bases, line_width
+            header = line.rstrip().decode('utf-8', errors='replace')
+            offset, seq_offset = end, end + len(line)
+            residues, line_count, line_bases, line_width, last_width = 0, 0, 0, 0, 0
+        elif header is not None:
+            bases = len(line.rstrip())
+            if line_count == 0:
+                line_bases, line_width = bases, len(line)
+            elif last_width != line_width or len(line) > line_width or bases == 0:
+                # Only the last line of a record may be shorter, samtools faidx has the same restriction
+                line_bases, line_width = 0, 0
+            residues += bases
+            line_count += 1
+            last_width = len(line)
+        end += len(line)
+    if header is not None:
+        yield header, offset, seq_offset, end, residues, line_count, line_bases, line_width
+
+
+class FastaPreflight(object):
+    """Summary and byte-offset index of a fasta file collected in a single streaming pass
+    """
+    def __init__(self, fasta_path):
+        self.path = fasta_path
+        # Sequence IDs in file order, duplicates included
+        self.ids = []
+        # key: Seq ID, val: index of its first record
+        self.id_index = {}
+        # Per record columns, in the same order as ids
+        self.offsets = array('q')
+        self.seq_offsets = array('q')
+        self.ends = array('q')
+        self.lengths = array('q')
+        self.line_counts = array('q')
+        self.line_bases = array('q')
+        self.line_widths = array('q')
+        # Reports
+        self.duplicates = []
+        self.over_limit = []
+        self.unparsable = []
+        # Lazily opened memory map of the fasta file
+        self._fp = None
+        self._mm = None
+
+    def __repr__(self):
+        return f'FastaPreflight(\'{self.path}\', {len(self.ids)})'
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_fp'], state['_mm'] = None, None
+        return state
+
+    def add_record(self, header, offset, seq_offset, end, residues, line_count, line_bases=0, line_width=0):
+        """Add a fasta record to the summary
+        Args:
+            header: fasta header
+            offset: Byte offset of the header line
+            seq_offset: Byte offset of the first sequence line
+            end: Byte offset right after the last line of the record
+            residues: Number of characters in the stripped sequence lines
+            line_count: Number of sequence lines
+            line_bases: Residues per line, 0 if the lines are not of equal length
+            line_width: Bytes per line including the line end, 0 if the lines are not of equal length
+        Raises:
+        Returns:
+        """
+        try:
+            header_id = fasta_header_id(header)
+        except (IndexError, KeyError):
+            self.unparsable.append(header)
+            return
+        self._add_id(header_id)
+        self.offsets.append(offset)
+        self.seq_offsets.append(seq_offset)
+        self.ends.append(end)
+        self.lengths.append(residues)
+        self.line_counts.append(line_count)
+        self.line_bases.append(line_bases)
+        self.line_widths.append(line_width)
+
+    def _add_id(self, header_id):
+        if len(header_id) > DEFAULT_PTOOLS_CHAR_LIMIT:
+            self.over_limit.append(header_id)
+        if header_id in self.id_index:
+            self.duplicates.append(header_id)
+        else:
+            self.id_index[header_id] = len(self.ids)
+        self.ids.append(header_id)
+
+    def joined_length(self, idx):
+        """Length of a record's sequence lines joined by newlines, i.e. the length "read_fasta" yields
+        Args:
+            idx: Index of the record
+        Raises: IndexError
+        Returns:
+            Length of the joined sequence string
+        """
+        return self.lengths[idx] + max(self.line_counts[idx] - 1, 0)
+
+    def total_residues(self):
+        return sum(self.lengths)
+
+    def open(self):
+        """Memory map the fasta file for random access
+        Args:
+        Raises: OSError
+        Returns:
+            The memory map, or an empty bytes object for an empty file
+        """
+        if self._mm is None:
+            self._fp = open(self.path, 'rb')
+            try:
+                self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                self._mm = b''
+        return self._mm
+
+    def close(self):
+        if self._mm is not None and not isinstance(self._mm, bytes):
+            self._mm.close()
+        if self._fp is not None:
+            self._fp.close()
+        self._fp, self._mm = None, None
+
+    def record_bytes(self, idx):
+        """Raw bytes of a record, header line included
+        Args:
+            idx: Index of the record
+        Raises: IndexError
+        Returns:
+            bytes of the record
+        """
+        return self.open()[self.offsets[idx]:self.ends[idx]]
+
+    def header(self, idx):
+        return self.open()[self.offsets[idx]:self.seq_offsets[idx]].rstrip().decode('utf-8', errors='replace')
+
+    def fetch(self, seq_id, start=0, stop=None):
+        """Fetch a sequence, or part of it, from the memory mapped fasta file
+        Args:
+            seq_id: Sequence ID, the first record is used for duplicated IDs
+            start: 0-based start position
+            stop: 0-based end position, exclusive
+        Raises: KeyError
+        Returns:
+            The sequence as a string
+        """
+        idx = self.id_index[seq_id]
+        length = self.lengths[idx]
+        if stop is None or stop > length:
+            stop = length
+        start = max(start, 0)
+        if start >= stop:
+            return ''
+        mm = self.open()
+        line_bases, line_width = self.line_bases[idx], self.line_widths[idx]
+        if line_bases > 0:
+            seq_offset = self.seq_offsets[idx]
+            first = seq_offset + (start // line_bases) * line_width + start % line_bases
+            last = seq_offset + ((stop - 1) // line_bases) * line_width + (stop - 1) % line_bases + 1
+            seq = b''.join(mm[first:last].split())
+        else:
+            seq = b''.join(line.rstrip() for line in mm[self.seq_offsets[idx]:self.ends[idx]].split(b'\n'))
+            seq = seq[start:stop]
+        return seq.decode('utf-8', errors='replace')
+
+    def sequence_bytes(self, idx):
+        """Sequence of a record with all whitespace removed
+        Args:
+            idx: Index of the record
+        Raises: IndexError
+        Returns:
+            bytes of the sequence
+        """
+        return b''.join(self.open()[self.seq_offsets[idx]:self.ends[idx]].split())
+
+    def write_records(self, indices, op, output_preflight=None):
+        """Copy records from the memory mapped fasta file to an output file
+        Args:
+            indices: Indices of the records to copy, in output order
+            op: Output file opened in binary mode
+            output_preflight: FastaPreflight of the output that the copied records are added to
+        Raises: IndexError
+        Returns:
+            Number of bytes written
+        """
+        mm = self.open()
+        written = 0
+        for idx in indices:
+            record = mm[self.offsets[idx]:self.ends[idx]]
+            if not record.endswith(b'\n'):
+                record += b'\n'
+            op.write(record)
+            if output_preflight is not None:
+                shift = written - self.offsets[idx]
+                output_preflight._add_id(self.ids[idx])
+                output_preflight.offsets.append(written)
+                output_preflight.seq_offsets.append(self.seq_offsets[idx] + shift)
+                output_preflight.ends.append(written + len(record))
+                output_preflight.lengths.append(self.lengths[idx])
+                output_preflight.line_counts.append(self.line_counts[idx])
+                output_preflight.line_bases.append(self.line_bases[idx])
+                output_preflight.line_widths.append(self.line_widths[idx])
+            written += len(record)
+        return written
+
+    def copy_records(self, indices, output_path, logger_name=DEFAULT_LOGGER_NAME):
+        """Write records to a new fasta file, along with its preflight
+        Args:
+            indices: Indices of the records to copy, in output order
+            output_path: Path to the new fasta file
+            logger_name: The name of the logger
+        Raises: IndexError, OSError
+        Returns:
+            output_preflight: FastaPreflight of the new file
+        """
+        output_preflight = FastaPreflight(output_path)
+        with open(output_path, 'wb') as op:
+            self.write_records(indices, op, output_preflight)
+        register_fasta_preflight(output_preflight, logger_name=logger_name)
+        return output_preflight
+
+    def write_index(self, index_path, stat_key):
+        """Write a samtools-style ".fai" index, with the file size and mtime it is valid for
+        Args:
+            index_path: Path to the index
+            stat_key: Tuple of real path, size and mtime of the fasta file
+        Raises: OSError
+        Returns:
+        """
+        with open(index_path, 'w') as op:
+            op.write('\t'.join(["#" + FASTA_INDEX_FORMAT, str(stat_key[1]), str(stat_key[2])]) + '\n')
+            for idx, seq_id in enumerate(self.ids):
+                # samtools columns: NAME, LENGTH, OFFSET, LINEBASES, LINEWIDTH; then header offset, end, lines
+                op.write('%s\t%d\t%d\t%d\t%d\t%d\t%d\t%d\n' % (
+                    seq_id, self.lengths[idx], self.seq_offsets[idx], self.line_bases[idx], self.line_widths[idx],
+                    self.offsets[idx], self.ends[idx], self.line_counts[idx]))
+
+    @staticmethod
+    def read_index(fasta_path, index_path, stat_key):
+        """Read an index written by write_index
+        Args:
+            fasta_path: Path to the fasta file
+            index_path: Path to the index
+            stat_key: Tuple of real path, size and mtime of the fasta file
+        Raises: OSError, ValueError
+        Returns:
+            FastaPreflight, or None if the index does not match the fasta file
+        """
+        fasta_preflight = FastaPreflight(fasta_path)
+        with open(index_path, 'r') as fp:
+            index_header = fp.readline().rstrip('\n').split('\t')
+            if index_header != ["#" + FASTA_INDEX_FORMAT, str(stat_key[1]), str(stat_key[2])]:
+                return None
+            for line in fp:
+                info = line.rstrip('\n').split('\t')
+                length, seq_offset, line_bases, line_width, offset, end, line_count = map(int, info[1:8])
+                fasta_preflight._add_id(info[0])
+                fasta_preflight.offsets.append(offset)
+                fasta_preflight.seq_offsets.append(seq_offset)
+                fasta_preflight.ends.append(end)
+                fasta_preflight.lengths.append(length)
+                fasta_preflight.line_counts.append(line_count)
+                fasta_preflight.line_bases.append(line_bases)
+                fasta_preflight.line_widths.append(line_width)
+        return fasta_preflight
+
+
+_fasta_preflight_cache = {}
+
+
+def _fasta_stat_key(fasta_path):
+    """Key a file, i.e. a fasta or mapping file, by its path, size and modification time
+    Args:
+        fasta_path: Path to the file
+    Raises: OSError
+    Returns:
+        Tuple of real path, size and mtime
+    """
+    real_path = os.path.realpath(fasta_path)
+    stat = os.stat(real_path)
+    return real_path, stat.st_size, stat.st_mtime_ns
+
+
+def _save_fasta_index(fasta_preflight, stat_key, logger_name=DEFAULT_LOGGER_NAME):
+    index_path = fasta_preflight.path + FASTA_INDEX_SUFFIX
+    try:
+        fasta_preflight.write_index(index_path, stat_key)
+    except OSError as e:
+        logging_helper("Cannot write fasta index \"" + index_path + "\": " + str(e), logging_level="DEBUG",
+                       logger_name=logger_name)
+
+
+def register_fasta_preflight(fasta_preflight, write_index=True, logger_name=DEFAULT_LOGGER_NAME):
+    """Store a preflight so that later calls of preflight_fasta on an unchanged file reuse it
+    Args:
+        fasta_preflight: FastaPreflight of a file on disk
+        write_index: Whether to also save it as an index next to the fasta file
+        logger_name: The name of the logger
+    Raises: OSError
+    Returns:
+    """
+    stat_key = _fasta_stat_key(fasta_preflight.path)
+    _fasta_preflight_cache[stat_key] = fasta_preflight
+    if write_index:
+        _save_fasta_index(fasta_preflight, stat_key, logger_name=logger_name)
+
+
+def preflight_fasta(fasta_path, write_index=True, logger_name=DEFAULT_LOGGER_NAME):
+    """Scan a fasta file once for its IDs, duplicate/over-length IDs, sequence lengths and byte offsets.
+       The result is reused, in memory or through the index next to the fasta file, for as long as the
+       file's size and modification time do not change.
+    Args:
+        fasta_path: Path to fasta input
+        write_index: Whether to save the scan as an index next to the fasta file
+        logger_name: The name of the logger
+    Raises: OSError
+    Returns:
+        fasta_preflight: FastaPreflight of the file
+    """
+    stat_key = _fasta_stat_key(fasta_path)
+    try:
+        return _fasta_preflight_cache[stat_key]
+    except KeyError:
+        pass
+    index_path = fasta_path + FASTA_INDEX_SUFFIX
+    fasta_preflight = None
+    if os.path.isfile(index_path):
+        try:
+            fasta_preflight = FastaPreflight.read_index(fasta_path, index_path, stat_key)
+        except (OSError, ValueError):
+            fasta_preflight = None
+        if fasta_preflight is not None:
+            logging_helper("Using fasta index: \"" + index_path + "\"", logging_level="DEBUG",
+                           logger_name=logger_name)
+    if fasta_preflight is None:
+        logging_helper("Scanning fasta: \"" + fasta_path + "\"", logging_level="DEBUG", logger_name=logger_name)
+        fasta_preflight = FastaPreflight(fasta_path)
+        with open(fasta_path, 'rb') as fp:
+            for record in scan_fasta_records(fp):
+                fasta_preflight.add_record(*record)
+        if write_index:
+            _save_fasta_index(fasta_preflight, stat_key, logger_name=logger_name)
+    _fasta_preflight_cache[stat_key] = fasta_preflight
+    return fasta_preflight
+
+
+def log_fasta_preflight(fasta_preflight, logger_name=DEFAULT_LOGGER_NAME):
+    """Log the header problems found by a fasta preflight
+    Args:
+        fasta_preflight: FastaPreflight
+        logger_name: The name of the logger
+    Raises:
+    Returns:
+    """
+    for header in fasta_preflight.unparsable:
+        logging_helper("Cannot Parse Header: " + header, logging_level="ERROR", logger_name=logger_name)
+    for header_id in fasta_preflight.over_limit:
+        logging_helper("ID exceeds Pathway-Tools character limit: " + header_id,
+                       logging_level="WARNING", logger_name=logger_name)
+    for header_id in fasta_preflight.duplicates:
+        logging_helper("Duplicate IDs: " + header_id, logging_level="ERROR", logger_name=logger_name)
+
+
 def check_fasta_header(fasta_path, logger_name=DEFAULT_LOGGER_NAME):
-    """Warn if fasta sequence ID length increases Pathway Tools current limit
+    """Warn if fasta sequence ID length increases Pathway Tools current limit, or if IDs are duplicated
     Args:
         fasta_path: The path to fasta input
         logger_name: The name of the logger for checking fasta header
-    Raises: IndexError, KeyError
+    Raises:
     Returns:
+        fasta_preflight: FastaPreflight of the input
     """
-    existing_headers = []
-    with open(fasta_path, 'r') as fp:
-        for header, seq in read_fasta(fp):
-            try:
-                header_info = re.split('[\s|]+', header)
-                header_id = header_info[0].replace('>', '', 1)
-                if len(header_id) > DEFAULT_PTOOLS_CHAR_LIMIT:
-                    logging_helper("ID exceeds Pathway-Tools character limit: " + header_id,
-                                   logging_level="WARNING", logger_name=logger_name)
-                if header_id in existing_headers:
-                    logging_helper("Duplicate IDs: " + header_id,
-                                   logging_level="ERROR", logger_name=logger_name)
-                    break
-                else:
-                    existing_headers.append(header_id)
-            except (IndexError, KeyError):
-                logging_helper("Cannot Parse Header: " + header,
-                               logging_level="ERROR", logger_name=logger_name)
-                continue
+    fasta_preflight = preflight_fasta(fasta_path, logger_name=logger_name)
+    log_fasta_preflight(fasta_preflight, logger_name=logger_name)
+    return fasta_preflight
 
 
 def remove_splice_variants_from_fasta(fasta_path, output_dir, prot_gene_map, logger_name=DEFAULT_LOGGER_NAME):
-    """Remove splice variants from input fasta
+    """Remove splice variants from input fasta, keeping the longest sequence of each locus.
+       The first pass picks the records from the fasta index, the second copies them out of the file,
+       so sequences are never all held in memory.
     Args:
         fasta_path: Path to fasta input
         output_dir: Path to splice variants removed fasta output
@@ -152,59 +569,133 @@ def remove_splice_variants_from_fasta(fasta_path, output_dir, prot_gene_map, log
     Returns:
     """
     logger = logging.getLogger(logger_name)
-    fasta_dict = {}
     # The input's header should already be formatted
     file_name, file_extension = os.path.splitext(os.path.basename(fasta_path))
     prot_gene_map_dict = read_e2p2_maps(prot_gene_map, 0, 1)
     output_path = os.path.join(output_dir, file_name + '.rmspl' + file_extension)
     if os.path.isfile(output_path):
         logger.log(logging.WARNING, "Output path %s exists, will overwrite..." % output_path)
-    with open(fasta_path, 'r') as fp:
-        for header, seq in read_fasta(fp):
-            try:
-                header_info = re.split('[\s|]+', header)
-                header_id = header_info[0].replace('>', '', 1)
-                try:
-                    locus = prot_gene_map_dict[header_id][0]
-                except KeyError:
-                    locus = header_id
-                fasta_tuple = fasta_dict.setdefault(locus, (header, seq))
-                if len(seq) > len(fasta_tuple[1]):
-                    fasta_dict[locus] = (header, seq)
-            except (IndexError, KeyError):
-                logging_helper("Cannot Parse Header: " + header,
-                               logging_level="WARNING", logger_name=logger_name)
-                continue
+    fasta_preflight = preflight_fasta(fasta_path, logger_name=logger_name)
+    for header in fasta_preflight.unparsable:
+        logging_helper("Cannot Parse Header: " + header, logging_level="WARNING", logger_name=logger_name)
+    # key: locus, val: index of the longest record, the first one wins ties
+    locus_records = {}
+    for idx, header_id in enumerate(fasta_preflight.ids):
+        try:
+            locus = prot_gene_map_dict[header_id][0]
+        except KeyError:
+            locus = header_id
+        locus_idx = locus_records.setdefault(locus, idx)
+        if fasta_preflight.joined_length(idx) > fasta_preflight.joined_length(locus_idx):
+            locus_records[locus] = idx
     logging_helper("Removing splice variants from: \"" + fasta_path + "\"",
                    logging_level="INFO", logger_name=logger_name)
-    with open(output_path, 'w') as op:
-        for locus in sorted(fasta_dict.keys()):
-            try:
-                header = fasta_dict[locus][0]
-                seq = fasta_dict[locus][1]
-                op.write(header + '\n' + seq + '\n')
-            except (IndexError, KeyError):
-                continue
+    # Record the output as it is written so that it does not need to be scanned again
+    output_preflight = FastaPreflight(output_path)
+    offset = 0
+    mm = fasta_preflight.open()
+    try:
+        with open(output_path, 'wb') as op:
+            for locus in sorted(locus_records.keys()):
+                idx = locus_records[locus]
+                # Strip trailing whitespace the same way "read_fasta" does
+                lines = mm[fasta_preflight.offsets[idx]:fasta_preflight.ends[idx]].splitlines()
+                record = lines[0].rstrip() + b'\n' + b'\n'.join(line.rstrip() for line in lines[1:]) + b'\n'
+                op.write(record)
+                for header, record_offset, seq_offset, end, residues, line_count, line_bases, line_width in \
+                        scan_fasta_records(io.BytesIO(record)):
+                    output_preflight.add_record(header, offset + record_offset, offset + seq_offset, offset + end,
+                                                residues, line_count, line_bases, line_width)
+                offset += len(record)
+    finally:
+        fasta_preflight.close()
+    register_fasta_preflight(output_preflight, logger_name=logger_name)
     return output_path
 
 
+def deduplicate_fasta(fasta_path, output_dir, logger_name=DEFAULT_LOGGER_NAME):
+    """Keep one record per distinct sequence, so that identical proteins are only classified once
+    Args:
+        fasta_path: Path to fasta input
+        output_dir: Folder of the deduplicated fasta output
+        logger_name: The name of the logger
+    Raises: OSError
+    Returns:
+        output_path: Path to the deduplicated fasta, the input path if all sequences are distinct
+        duplicate_ids: key: ID of the record that was kept, val: IDs of the records with the same sequence
+    """
+    fasta_preflight = preflight_fasta(fasta_path, logger_name=logger_name)
+    # key: sequence digest, val: index of the first record with the sequence
+    seq_digests = {}
+    kept_records = []
+    duplicate_ids = {}
+    try:
+        for idx, header_id in enumerate(fasta_preflight.ids):
+            seq_digest = hashlib.sha1(fasta_preflight.sequence_bytes(idx)).digest()
+            kept_idx = seq_digests.setdefault(seq_digest, idx)
+            if kept_idx == idx:
+                kept_records.append(idx)
+            elif fasta_preflight.ids[kept_idx] != header_id:
+                duplicate_ids.setdefault(fasta_preflight.ids[kept_idx], []).append(header_id)
+        num_of_records = len(fasta_preflight)
+        logging_helper("Deduplicated sequences: %d of %d unique (ratio %.4f)" %
+                       (len(kept_records), num_of_records, len(kept_records) / max(num_of_records, 1)),
+                       logging_level="INFO", logger_name=logger_name)
+        if len(kept_records) == num_of_records:
+            return fasta_path, duplicate_ids
+        file_name, file_extension = os.path.splitext(os.path.basename(fasta_path))
+        output_path = os.path.join(output_dir, file_name + '.dedup' + file_extension)
+        fasta_preflight.copy_records(kept_records, output_path, logger_name=logger_name)
+    finally:
+        fasta_preflight.close()
+    return output_path, duplicate_ids
+
+
+def split_fasta(fasta_path, output_dir, num_of_shards, logger_name=DEFAULT_LOGGER_NAME):
+    """Split a fasta file into consecutive shards with about the same number of residues each
+    Args:
+        fasta_path: Path to fasta input
+        output_dir: Folder of the shards
+        num_of_shards: Number of shards to split into, fewer are written for small inputs
+        logger_name: The name of the logger
+    Raises: OSError
+    Returns:
+        shard_paths: List of paths to the shards, in input order
+    """
+    fasta_preflight = preflight_fasta(fasta_path, logger_name=logger_name)
+    num_of_records = len(fasta_preflight)
+    num_of_shards = max(min(num_of_shards, num_of_records), 1)
+    total_residues = fasta_preflight.total_residues()
+    bounds = [0]
+    cumulative_residues = 0
+    for idx, residues in enumerate(fasta_preflight.lengths):
+        cumulative_residues += residues
+        if len(bounds) < num_of_shards and idx + 1 < num_of_records and \
+                cumulative_residues * num_of_shards >= total_residues * len(bounds):
+            bounds.append(idx + 1)
+    bounds.append(num_of_records)
+    file_name, file_extension = os.path.splitext(os.path.basename(fasta_path))
+    shard_paths = []
+    try:
+        for shard_idx in range(len(bounds) - 1):
+            shard_path = os.path.join(output_dir, "%s.shard%04d%s" % (file_name, shard_idx + 1, file_extension))
+            fasta_preflight.copy_records(range(bounds[shard_idx], bounds[shard_idx + 1]), shard_path,
+                                         logger_name=logger_name)
+            shard_paths.append(shard_path)
+    finally:
+        fasta_preflight.close()
+    logging_helper("Split \"" + fasta_path + "\" into " + str(len(shard_paths)) + " shards",
+                   logging_level="INFO", logger_name=logger_name)
+    return shard_paths
+
+
 def get_all_seq_ids_from_fasta(fasta_path, logger_name=DEFAULT_LOGGER_NAME):
     """Get all sequence IDs from a fasta file
     Args:
         fasta_path: Path to fasta input
         logger_name: The name of the logger
-    Raises: IndexError, KeyError
+    Raises: OSError
     Returns:
+        List of sequence IDs in file order
     """
-    seq_ids = []
-    with open(fasta_path, 'r') as fp:
-        for header, seq in read_fasta(fp):
-            try:
-                header_info = re.split('[|\s]+', header)
-                header_id = header_info[0].replace('>', '', 1)
-                seq_ids.append(header_id)
-            except (IndexError, KeyError):
-                logging_helper("Cannot Parse Header: " + header,
-                               logging_level="WARNING", logger_name=logger_name)
-                continue
-    return seq_ids
+    return list(preflight_fasta(fasta_path, logger_name=logger_name).ids)
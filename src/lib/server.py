@@ -0,0 +1,288 @@
+import http.server
+import json
+import os
+import queue
+import shutil
+import socketserver
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+from src.definitions import DEFAULT_LOGGER_NAME
+from src.lib.process import logging_helper
+from src.lib.read import preflight_fasta
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class AnnotationJob(object):
+    """A FASTA job submitted to the server
+    """
+    def __init__(self, job_id, fasta_path):
+        """Initialize class
+        Args:
+            job_id: ID of the job, also the name of its input and of its folder
+            fasta_path: Path to the job's protein sequences
+        """
+        self.id = job_id
+        self.fasta_path = fasta_path
+        self.folder = os.path.dirname(fasta_path)
+        self.status = JOB_QUEUED
+        self.error = None
+        self.num_of_sequences = 0
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def __repr__(self):
+        return f'AnnotationJob(\'{self.id}\', \'{self.status}\')'
+
+    def outputs(self):
+        """Names of the output files of the job
+        Args:
+        Raises:
+        Returns:
+            Sorted list of file names
+        """
+        if self.status != JOB_DONE:
+            return []
+        return sorted([file_name for file_name in os.listdir(self.folder)
+                       if file_name.startswith(self.id + '.') and not file_name.endswith(('.fa', '.fai'))])
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "sequences": self.num_of_sequences,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            "outputs": self.outputs()
+        }
+
+
+class AnnotationServer(object):
+    """Server keeping the pipeline loaded and running submitted FASTA jobs. Jobs waiting together are run as one
+       batch, so the classifiers start once for all of them.
+    """
+    def __init__(self, run_jobs, work_dir, batch_size=16, batch_wait=1.0, max_batches=1, max_queued=100,
+                 logger_name=DEFAULT_LOGGER_NAME):
+        """Initialize class
+        Args:
+            run_jobs: Function called with a list of AnnotationJob and a batch folder, writes each job's outputs
+                into the job's folder
+            work_dir: Folder of the job and batch folders
+            batch_size: Maximum number of jobs run as one batch
+            batch_wait: Seconds the first job of a batch waits for more jobs
+            max_batches: Maximum number of batches running at the same time
+            max_queued: Maximum number of queued jobs, further jobs are refused
+            logger_name: The name of the logger
+        """
+        self.run_jobs = run_jobs
+        self.work_dir = os.path.realpath(work_dir)
+        self.jobs_dir = os.path.join(self.work_dir, "jobs")
+        self.batches_dir = os.path.join(self.work_dir, "batches")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        os.makedirs(self.batches_dir, exist_ok=True)
+        self.batch_size = max(int(batch_size), 1)
+        self.batch_wait = max(float(batch_wait), 0)
+        self.max_batches = max(int(max_batches), 1)
+        self.logger_name = logger_name
+        self.queue = queue.Queue(maxsize=max(int(max_queued), 1))
+        # key: job ID, val: AnnotationJob
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._batch_count = 0
+        self._dispatchers = []
+        self._http_server = None
+
+    def __repr__(self):
+        return f'AnnotationServer(\'{self.work_dir}\', {self.batch_size}, {self.max_batches})'
+
+    def submit(self, fasta_bytes):
+        """Queue a FASTA job
+        Args:
+            fasta_bytes: Protein sequences in FASTA format
+        Raises: ValueError, queue.Full
+        Returns:
+            AnnotationJob
+        """
+        job_id = uuid.uuid4().hex
+        job_folder = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_folder)
+        job = AnnotationJob(job_id, os.path.join(job_folder, job_id + ".fa"))
+        try:
+            with open(job.fasta_path, 'wb') as op:
+                op.write(fasta_bytes)
+            job.num_of_sequences = len(preflight_fasta(job.fasta_path, logger_name=self.logger_name).ids)
+            if job.num_of_sequences == 0:
+                raise ValueError("No sequences found in the submitted FASTA")
+            with self._lock:
+                self.jobs[job_id] = job
+            self.queue.put_nowait(job)
+        except (ValueError, queue.Full):
+            with self._lock:
+                self.jobs.pop(job_id, None)
+            shutil.rmtree(job_folder, ignore_errors=True)
+            raise
+        logging_helper("Queued job %s with %d sequences" % (job_id, job.num_of_sequences), logging_level="INFO",
+                       logger_name=self.logger_name)
+        return job
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _next_batch(self):
+        """Wait for a job, then for more jobs until the batch is full or the wait is over
+        Args:
+        Raises:
+        Returns:
+            List of AnnotationJob, None once the server stops
+        """
+        job = self.queue.get()
+        if job is None:
+            return None
+        jobs = [job]
+        deadline = time.monotonic() + self.batch_wait
+        while len(jobs) < self.batch_size:
+            try:
+                job = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if job is None:
+                # Pass the stop on to the other dispatchers
+                self.queue.put(None)
+                break
+            jobs.append(job)
+        return jobs
+
+    def _dispatch(self):
+        while True:
+            jobs = self._next_batch()
+            if jobs is None:
+                break
+            with self._lock:
+                self._batch_count += 1
+                batch_folder = os.path.join(self.batches_dir, "batch%06d" % self._batch_count)
+            os.makedirs(batch_folder, exist_ok=True)
+            for job in jobs:
+                job.status, job.started = JOB_RUNNING, time.time()
+            logging_helper("Running %d jobs in \"%s\"" % (len(jobs), batch_folder), logging_level="INFO",
+                           logger_name=self.logger_name)
+            try:
+                self.run_jobs(jobs, batch_folder)
+            except (Exception, SystemExit) as e:
+                logging_helper("Batch \"%s\" failed: %s" % (batch_folder, repr(e)), logging_level="ERROR",
+                               logger_name=self.logger_name)
+                for job in jobs:
+                    job.status, job.error = JOB_FAILED, repr(e)
+            else:
+                for job in jobs:
+                    job.status = JOB_DONE
+            for job in jobs:
+                job.finished = time.time()
+
+    def start(self):
+        """Start the threads running the queued jobs
+        Args:
+        Raises:
+        Returns:
+        """
+        for _ in range(self.max_batches):
+            dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+            dispatcher.start()
+            self._dispatchers.append(dispatcher)
+
+    def serve(self, host="127.0.0.1", port=0, socket_path=None):
+        """Serve the job API over HTTP on a host and port, or on a Unix socket, until interrupted
+           POST /jobs with a FASTA body queues a job; GET /jobs/<id> returns its status;
+           GET /jobs/<id>/outputs/<file name> returns an output; GET /health returns the queue state.
+        Args:
+            host: Host to listen on
+            port: Port to listen on, any free port if 0
+            socket_path: Path to a Unix socket to listen on instead of a host and port
+        Raises: OSError
+        Returns:
+        """
+        handler = _make_request_handler(self)
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            self._http_server = _ThreadingUnixHTTPServer(socket_path, handler)
+            address = "unix:" + socket_path
+        else:
+            self._http_server = http.server.ThreadingHTTPServer((host, port), handler)
+            address = "http://%s:%d" % self._http_server.server_address[:2]
+        self.start()
+        logging_helper("Serving E2P2 jobs on " + address, logging_level="INFO", logger_name=self.logger_name)
+        try:
+            self._http_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        if self._http_server is not None:
+            self._http_server.server_close()
+        self.queue.put(None)
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _make_request_handler(server):
+    class JobRequestHandler(http.server.BaseHTTPRequestHandler):
+        def address_string(self):
+            # Unix socket clients have no address
+            return str(self.client_address[0]) if self.client_address else "local"
+
+        def log_message(self, log_format, *args):
+            logging_helper("Server request: " + (log_format % args), logging_level="DEBUG",
+                           logger_name=server.logger_name)
+
+        def _send(self, code, body, content_type="application/json"):
+            if not isinstance(body, bytes):
+                body = (json.dumps(body, indent=2) + '\n').encode()
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if urlparse(self.path).path.rstrip('/') != "/jobs":
+                return self._send(404, {"error": "Not found"})
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                job = server.submit(body)
+            except ValueError as e:
+                return self._send(400, {"error": str(e)})
+            except queue.Full:
+                return self._send(503, {"error": "Job queue is full"})
+            self._send(202, job.to_dict())
+
+        def do_GET(self):
+            path = [p for p in urlparse(self.path).path.split('/') if p != '']
+            if path == ["health"]:
+                return self._send(200, {"status": "ok", "queued": server.queue.qsize(), "jobs": len(server.jobs)})
+            if len(path) < 2 or path[0] != "jobs":
+                return self._send(404, {"error": "Not found"})
+            job = server.get_job(path[1])
+            if job is None:
+                return self._send(404, {"error": "Unknown job"})
+            if len(path) == 2:
+                return self._send(200, job.to_dict())
+            if len(path) == 4 and path[2] == "outputs" and path[3] in job.outputs():
+                with open(os.path.join(job.folder, path[3]), 'rb') as fp:
+                    return self._send(200, fp.read(), "text/plain")
+            self._send(404, {"error": "Unknown output"})
+
+    return JobRequestHandler
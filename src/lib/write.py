@@ -6,8 +6,9 @@ from src.definitions import DEFAULT_LOGGER_LEVEL, DEFAULT_LOGGER_NAME, DEFAULT_L
     DEFAULT_PF_OUTPUT_SUFFIX, DEFAULT_ORXN_PF_OUTPUT_SUFFIX, DEFAULT_FINAL_PF_OUTPUT_SUFFIX
 from src.lib.classifier import Classifier, FunctionClass
 from src.lib.ensemble import Ensemble
+from src.lib.metrics import get_metrics
 from src.lib.process import logging_helper
-from src.lib.read import read_e2p2_maps
+from src.lib.read import load_e2p2_map
 
 
 class PfFiles(object):
@@ -118,7 +119,7 @@ class PfFiles(object):
         Raises: AttributeError, KeyError
         Returns:
         """
-        ef_map_dict = read_e2p2_maps(ef_map_path, 0, 1)
+        ef_map_dict = load_e2p2_map(ef_map_path, 0, 1)
         with open(output_path, 'w') as op:
             try:
                 for query in sorted(self.final_prediction.keys()):
@@ -196,13 +197,13 @@ class PfFiles(object):
         Raises: AttributeError, KeyError
         Returns:
         """
-        ef_map_dict = read_e2p2_maps(ef_map_path, 0, 1)
-        ec_superseded_dict = read_e2p2_maps(ec_superseded_path, 2, 0)
-        metacyc_rxn_ec_dict = read_e2p2_maps(metacyc_rxn_ec_path, 1, 0)
-        official_ec_metacyc_rxn_dict = read_e2p2_maps(official_ec_metacyc_rxn_path, 0, 1)
-        to_remove_metabolism_list = sorted(read_e2p2_maps(to_remove_metabolism_path, 0, 0).keys())
+        ef_map_dict = load_e2p2_map(ef_map_path, 0, 1)
+        ec_superseded_dict = load_e2p2_map(ec_superseded_path, 2, 0)
+        metacyc_rxn_ec_dict = load_e2p2_map(metacyc_rxn_ec_path, 1, 0)
+        official_ec_metacyc_rxn_dict = load_e2p2_map(official_ec_metacyc_rxn_path, 0, 1)
+        to_remove_metabolism_list = sorted(load_e2p2_map(to_remove_metabolism_path, 0, 0).keys())
         if prot_gene_map_path is not None:
-            prot_gene_map_dict = read_e2p2_maps(prot_gene_map_path, 0, 1)
+            prot_gene_map_dict = load_e2p2_map(prot_gene_map_path, 0, 1)
         else:
             prot_gene_map_dict = {}
         with open(output_path, 'w') as op:
@@ -281,26 +282,32 @@ def write_ensemble_outputs(ensemble_cls, all_query_ids, output_path, ef_map_path
 
     output_name, output_ext = os.path.splitext(output_path)
 
+    metrics = get_metrics(logger_name)
     ensemble_output = PfFiles(ensemble_cls, all_query_ids)
     short_output_path = '.'.join([output_name, ensemble_name, output_ext.lstrip(".")])
-    ensemble_output.write_short_results(ensemble_name, short_output_path, logging_level="INFO", logger_name=logger_name)
+    with metrics.stage("write short " + ensemble_name, queries=len(ensemble_output.final_prediction)):
+        ensemble_output.write_short_results(ensemble_name, short_output_path, logging_level="INFO",
+                                            logger_name=logger_name)
 
     long_output_path = '.'.join([output_name, ensemble_name, DEFAULT_LONG_OUTPUT_SUFFIX])
-    ensemble_output.write_long_results(ensemble_classifiers, ensemble_name, long_output_path, logging_level="INFO",
-                                       logger_name=logger_name)
+    with metrics.stage("write long " + ensemble_name, queries=len(ensemble_output.final_prediction)):
+        ensemble_output.write_long_results(ensemble_classifiers, ensemble_name, long_output_path, logging_level="INFO",
+                                           logger_name=logger_name)
 
     pf_output_path = '.'.join([output_name, ensemble_name, DEFAULT_PF_OUTPUT_SUFFIX])
-    ensemble_output.write_pf_results(ef_map_path, pf_output_path, logging_level="INFO", logger_name=logger_name)
+    with metrics.stage("write pf " + ensemble_name, queries=len(ensemble_output.final_prediction)):
+        ensemble_output.write_pf_results(ef_map_path, pf_output_path, logging_level="INFO", logger_name=logger_name)
 
     orxn_output_path = '.'.join([output_name, ensemble_name, DEFAULT_ORXN_PF_OUTPUT_SUFFIX])
-    ensemble_output.write_orxn_results(ef_map_path, ec_superseded_path, metacyc_rxn_ec_path,
-                                       official_ec_metacyc_rxn_path, to_remove_metabolism_path, orxn_output_path,
-                                       prot_gene_map_path=None, logging_level="INFO",
-                                       logger_name=logger_name)
-    if prot_gene_map_path is not None:
-        final_output_path = '.'.join([output_name, ensemble_name, DEFAULT_FINAL_PF_OUTPUT_SUFFIX])
+    with metrics.stage("write orxn " + ensemble_name, queries=len(ensemble_output.final_prediction)):
         ensemble_output.write_orxn_results(ef_map_path, ec_superseded_path, metacyc_rxn_ec_path,
-                                           official_ec_metacyc_rxn_path, to_remove_metabolism_path, final_output_path,
-                                           prot_gene_map_path=prot_gene_map_path, logging_level="INFO",
+                                           official_ec_metacyc_rxn_path, to_remove_metabolism_path, orxn_output_path,
+                                           prot_gene_map_path=None, logging_level="INFO",
                                            logger_name=logger_name)
-
+    if prot_gene_map_path is not None:
+        final_output_path = '.'.join([output_name, ensemble_name, DEFAULT_FINAL_PF_OUTPUT_SUFFIX])
+        with metrics.stage("write final " + ensemble_name, queries=len(ensemble_output.final_prediction)):
+            ensemble_output.write_orxn_results(ef_map_path, ec_superseded_path, metacyc_rxn_ec_path,
+                                               official_ec_metacyc_rxn_path, to_remove_metabolism_path,
+                                               final_output_path, prot_gene_map_path=prot_gene_map_path,
+                                               logging_level="INFO", logger_name=logger_name)